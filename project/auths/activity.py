@@ -0,0 +1,151 @@
+import logging
+import time
+import uuid
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.db import connections, router
+from django.db.models import Case, When
+from redis.exceptions import ResponseError
+
+from auths.cache import get_redis
+from auths.models import ProjectUser
+
+
+logger = logging.getLogger(__name__)
+
+# Every user seen recently, scored by the unix time they were last seen.
+# The hash tag keeps all activity keys on one Redis node.
+LAST_SEEN_KEY = 'auth:{last_seen}'
+
+# Users seen since the previous flush to ProjectUser.last_login.
+PENDING_KEY = 'auth:{last_seen}:pending'
+
+
+def touch(user_id):
+
+    """Records activity of a user. Never raises, activity tracking is best effort."""
+
+    if user_id is None:
+
+        return
+
+    now = time.time()
+
+    try:
+
+        pipe = get_redis(LAST_SEEN_KEY).pipeline(transaction=False)
+        pipe.zadd(LAST_SEEN_KEY, {user_id: now})
+        pipe.zadd(PENDING_KEY, {user_id: now})
+        pipe.execute()
+
+    except Exception:
+
+        logger.exception('Failed to record activity of user %s', user_id)
+
+
+def active_user_count(window):
+
+    """Number of users seen in the last `window` seconds."""
+
+    return get_redis(LAST_SEEN_KEY).zcount(LAST_SEEN_KEY, time.time() - window, '+inf')
+
+
+def active_user_ids(window, limit=100):
+
+    """Ids of users seen in the last `window` seconds, most recent first."""
+
+    ids = get_redis(LAST_SEEN_KEY).zrevrangebyscore(
+        LAST_SEEN_KEY, '+inf', time.time() - window, start=0, num=limit
+    )
+
+    return [int(user_id) for user_id in ids]
+
+
+def update_last_login(rows):
+
+    """Writes (user_id, unix_time) rows to ProjectUser.last_login with a single UPDATE."""
+
+    using = router.db_for_write(ProjectUser)
+
+    connection = connections[using]
+
+    rows = [(int(user_id), datetime.fromtimestamp(seen, tz=timezone.utc)) for user_id, seen in rows]
+
+    if connection.vendor != 'postgresql':
+
+        ProjectUser.objects.using(using).filter(id__in=[user_id for user_id, _ in rows]).update(
+            last_login=Case(*[When(id=user_id, then=seen) for user_id, seen in rows])
+        )
+
+        return
+
+    table = connection.ops.quote_name(ProjectUser._meta.db_table)
+
+    values = ', '.join(['(%s::bigint, %s::timestamptz)'] * len(rows))
+
+    with connection.cursor() as cursor:
+
+        cursor.execute(
+            f'UPDATE {table} AS u SET last_login = v.seen '
+            f'FROM (VALUES {values}) AS v(id, seen) '
+            'WHERE u.id = v.id AND (u.last_login IS NULL OR u.last_login < v.seen)',
+            [value for row in rows for value in row]
+        )
+
+
+def flush(batch_size=None):
+
+    """
+    Moves pending activity from Redis to ProjectUser.last_login.
+
+    The pending set is renamed first, so activity recorded during the flush
+    lands in a fresh set and is picked up by the next run. Returns the number
+    of users written.
+    """
+
+    batch_size = batch_size or settings.LAST_SEEN_FLUSH_BATCH_SIZE
+
+    redis = get_redis(LAST_SEEN_KEY)
+
+    flushing_key = f'{PENDING_KEY}:flushing:{uuid.uuid4().hex}'
+
+    try:
+
+        redis.rename(PENDING_KEY, flushing_key)
+
+    except ResponseError:
+
+        # Nothing recorded since the previous flush.
+        return 0
+
+    written = 0
+
+    try:
+
+        while True:
+
+            rows = redis.zrange(flushing_key, written, written + batch_size - 1, withscores=True)
+
+            if not rows:
+
+                break
+
+            update_last_login(rows)
+
+            written += len(rows)
+
+    except Exception:
+
+        # Put unwritten activity back for the next run, keeping the newest timestamp.
+        redis.zunionstore(PENDING_KEY, [PENDING_KEY, flushing_key], aggregate='MAX')
+
+        raise
+
+    finally:
+
+        redis.delete(flushing_key)
+
+    redis.zremrangebyscore(LAST_SEEN_KEY, '-inf', time.time() - settings.LAST_SEEN_RETENTION)
+
+    return written
@@ -1,3 +1,159 @@
 from django.contrib import admin
+from django.contrib.admin.views.main import PAGE_VAR, ChangeList
+from django.core.paginator import Paginator
+from django.db import connections
 
-# Register your models here.
+from auths.bulk import deactivate_users, force_logout_users
+from auths.models import ProjectUser
+
+
+# Query parameter carrying the last id of the previous changelist page.
+AFTER_VAR = 'after'
+
+# Filtered changelists count at most this many rows.
+COUNT_LIMIT = 10000
+
+
+def estimate_count(queryset):
+
+    """
+    Row count of a changelist queryset without a full table scan.
+
+    An unfiltered queryset on PostgreSQL is answered from the planner's
+    statistics in pg_class, anything else is counted up to COUNT_LIMIT rows.
+    """
+
+    connection = connections[queryset.db]
+
+    if not queryset.query.where and connection.vendor == 'postgresql':
+
+        with connection.cursor() as cursor:
+
+            cursor.execute(
+                'SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass',
+                [queryset.model._meta.db_table]
+            )
+
+            row = cursor.fetchone()
+
+        # -1 until the table has been analyzed for the first time.
+        if row and row[0] >= 0:
+
+            return row[0]
+
+    return queryset.order_by().values('pk')[:COUNT_LIMIT].count()
+
+
+class EstimatedCountPaginator(Paginator):
+
+    """Paginator reporting a precomputed count instead of running COUNT(*)."""
+
+    def __init__(self, object_list, per_page, count, **kwargs):
+
+        super().__init__(object_list, per_page, **kwargs)
+
+        self.count = count
+
+
+class KeysetChangeList(ChangeList):
+
+    """
+    Changelist paginated by primary key instead of OFFSET.
+
+    Each page fetches `list_per_page + 1` rows with `id > after`, so the cost
+    of a page does not depend on how deep it is, and the total shown is an
+    estimate from `estimate_count`.
+    """
+
+    def get_filters_params(self, params=None):
+
+        lookup_params = super().get_filters_params(params)
+
+        lookup_params.pop(AFTER_VAR, None)
+
+        return lookup_params
+
+    def get_results(self, request):
+
+        try:
+
+            after = int(self.params.get(AFTER_VAR, 0))
+
+        except ValueError:
+
+            after = 0
+
+        rows = list(self.queryset.filter(pk__gt=after).order_by('pk')[:self.list_per_page + 1])
+
+        self.result_list = rows[:self.list_per_page]
+
+        self.result_count = estimate_count(self.queryset)
+
+        self.full_result_count = None
+
+        self.show_full_result_count = False
+
+        self.show_admin_actions = True
+
+        self.can_show_all = False
+
+        self.multi_page = bool(after) or len(rows) > self.list_per_page
+
+        self.paginator = EstimatedCountPaginator(self.queryset, self.list_per_page, self.result_count)
+
+        self.first_page_url = self.get_query_string(remove=[AFTER_VAR, PAGE_VAR]) if after else None
+
+        self.next_page_url = None
+
+        if len(rows) > self.list_per_page:
+
+            self.next_page_url = self.get_query_string({AFTER_VAR: self.result_list[-1].pk}, [PAGE_VAR])
+
+
+@admin.register(ProjectUser)
+class ProjectUserAdmin(admin.ModelAdmin):
+
+    list_display = ['id', 'nickname', 'email', 'username', 'is_active', 'is_staff']
+
+    list_filter = ['is_active', 'is_staff']
+
+    # Exact email and nickname prefix, both served by expression indexes.
+    search_fields = ['=email', '^nickname']
+
+    sortable_by = []
+
+    show_full_result_count = False
+
+    exclude = ['password']
+
+    readonly_fields = ['last_login', 'token_version']
+
+    actions = ['deactivate_selected', 'force_logout_selected']
+
+    def get_changelist(self, request, **kwargs):
+
+        return KeysetChangeList
+
+    def get_queryset(self, request):
+
+        queryset = super().get_queryset(request)
+
+        if request.resolver_match and request.resolver_match.url_name.endswith('changelist'):
+
+            queryset = queryset.only(*self.list_display)
+
+        return queryset
+
+    @admin.action(description='Deactivate selected users and log them out')
+    def deactivate_selected(self, request, queryset):
+
+        processed = deactivate_users(queryset)
+
+        self.message_user(request, f'Deactivated {processed} users.')
+
+    @admin.action(description='Log selected users out everywhere')
+    def force_logout_selected(self, request, queryset):
+
+        processed = force_logout_users(queryset)
+
+        self.message_user(request, f'Logged out {processed} users.')
@@ -0,0 +1,354 @@
+import logging
+import socket
+import threading
+import time
+from collections import Counter
+
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+from django.conf import settings
+
+from auths.cache import get_redis
+
+
+logger = logging.getLogger(__name__)
+
+NODE_NAME = socket.gethostname()
+
+# Takes a node slot. Every increment renews the TTL, so the counter only
+# expires once the node has been idle for the whole TTL.
+# KEYS: counter; ARGV: ttl
+ACQUIRE_NODE_SLOT_SCRIPT = """
+local in_flight = redis.call('INCR', KEYS[1])
+redis.call('EXPIRE', KEYS[1], ARGV[1])
+return in_flight
+"""
+
+# Releases a node slot. A counter that expired meanwhile is left alone
+# rather than recreated below zero.
+# KEYS: counter; ARGV: ttl
+RELEASE_NODE_SLOT_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return 0
+end
+local in_flight = redis.call('DECR', KEYS[1])
+if in_flight < 0 then
+    redis.call('SET', KEYS[1], 0)
+    in_flight = 0
+end
+redis.call('EXPIRE', KEYS[1], ARGV[1])
+return in_flight
+"""
+
+# Hash of admitted/shed counters of every worker, fields '<node>:<scope>:<outcome>'.
+STATS_KEY = 'admission:stats'
+
+_controllers = {}
+
+_controllers_lock = threading.Lock()
+
+_stats = Counter()
+
+# Counts not yet added to STATS_KEY.
+_unpublished = Counter()
+
+_published_at = time.monotonic()
+
+_stats_lock = threading.Lock()
+
+
+class ServiceOverloaded(APIException):
+
+    """Raised when an endpoint is saturated and the request is shed."""
+
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+
+    default_code = 'service_overloaded'
+
+    def __init__(self, wait):
+
+        super().__init__({"errors": {"message": "Service is busy, please retry later."}})
+
+        self.wait = wait
+
+
+class AdmissionTicket:
+
+    """Slot held by an admitted request, released once the response is ready."""
+
+    def __init__(self, controller, node_slot):
+
+        self.controller = controller
+
+        self.node_slot = node_slot
+
+    def release(self):
+
+        self.controller.release(self)
+
+
+class AdmissionController:
+
+    """
+    Bounds the number of in-flight requests for one endpoint.
+
+    The worker limit is enforced with an in-process semaphore, optionally
+    waiting up to `queue_timeout` seconds for a free slot. The node limit
+    is shared by every worker on the host through a Redis counter.
+    """
+
+    def __init__(self, scope, worker_limit, node_limit=None, queue_timeout=0, retry_after=1, node_counter_ttl=60):
+
+        self.scope = scope
+
+        self.semaphore = threading.BoundedSemaphore(worker_limit)
+
+        self.node_limit = node_limit
+
+        self.queue_timeout = queue_timeout
+
+        self.retry_after = retry_after
+
+        self.node_counter_ttl = node_counter_ttl
+
+        self.node_key = f'admission:{scope}:{NODE_NAME}'
+
+    def acquire_worker_slot(self):
+
+        if self.queue_timeout:
+
+            return self.semaphore.acquire(timeout=self.queue_timeout)
+
+        return self.semaphore.acquire(blocking=False)
+
+    def acquire_node_slot(self):
+
+        if not self.node_limit:
+
+            return False
+
+        try:
+
+            redis = get_redis(self.node_key)
+            in_flight = redis.eval(ACQUIRE_NODE_SLOT_SCRIPT, 1, self.node_key, self.node_counter_ttl)
+
+        except Exception:
+
+            # Redis being unavailable must not take the endpoint down with it.
+            logger.exception('Node admission counter unavailable for %s', self.scope)
+            return False
+
+        if in_flight > self.node_limit:
+
+            self.release_node_slot()
+            raise ServiceOverloaded(self.retry_after)
+
+        return True
+
+    def release_node_slot(self):
+
+        try:
+
+            redis = get_redis(self.node_key)
+            redis.eval(RELEASE_NODE_SLOT_SCRIPT, 1, self.node_key, self.node_counter_ttl)
+
+        except Exception:
+
+            logger.exception('Failed to release node admission slot for %s', self.scope)
+
+    def admit(self):
+
+        if not self.acquire_worker_slot():
+
+            self.shed()
+
+        try:
+
+            node_slot = self.acquire_node_slot()
+
+        except ServiceOverloaded:
+
+            self.semaphore.release()
+            self.shed()
+
+        record(self.scope, 'admitted')
+
+        return AdmissionTicket(self, node_slot)
+
+    def shed(self):
+
+        record(self.scope, 'shed')
+
+        logger.warning('Shedding request for %s', self.scope)
+
+        raise ServiceOverloaded(self.retry_after)
+
+    def release(self, ticket):
+
+        if ticket.node_slot:
+
+            self.release_node_slot()
+
+        self.semaphore.release()
+
+
+def record(scope, outcome):
+
+    global _published_at
+
+    with _stats_lock:
+
+        _stats[(scope, outcome)] += 1
+
+        _unpublished[(scope, outcome)] += 1
+
+        if time.monotonic() - _published_at < settings.AUTH_ADMISSION_STATS_INTERVAL:
+
+            return
+
+        _published_at = time.monotonic()
+
+        counts = dict(_unpublished)
+
+        _unpublished.clear()
+
+    publish_stats(counts)
+
+
+def publish_stats(counts):
+
+    """
+    Adds the counts of this worker to STATS_KEY and logs its totals.
+
+    Runs on the request thread at most once per AUTH_ADMISSION_STATS_INTERVAL,
+    costing one Redis pipeline. Counts that fail to publish are kept for the
+    next attempt.
+    """
+
+    logger.info('Admission stats of worker on %s: %s', NODE_NAME, admission_stats())
+
+    try:
+
+        pipe = get_redis(STATS_KEY).pipeline(transaction=False)
+
+        for (scope, outcome), count in counts.items():
+
+            pipe.hincrby(STATS_KEY, f'{NODE_NAME}:{scope}:{outcome}', count)
+
+        pipe.execute()
+
+    except Exception:
+
+        logger.exception('Failed to publish admission stats')
+
+        with _stats_lock:
+
+            _unpublished.update(counts)
+
+
+def admission_stats():
+
+    """Returns the admitted/shed counters of the current worker, keyed by scope."""
+
+    with _stats_lock:
+
+        stats = {}
+
+        for (scope, outcome), count in _stats.items():
+
+            stats.setdefault(scope, {'admitted': 0, 'shed': 0})[outcome] = count
+
+        return stats
+
+
+def published_stats():
+
+    """
+    Returns the admitted/shed counters published by every worker, keyed by
+    node and scope. They lag the workers by up to AUTH_ADMISSION_STATS_INTERVAL.
+    """
+
+    stats = {}
+
+    for field, count in get_redis(STATS_KEY).hgetall(STATS_KEY).items():
+
+        node, scope, outcome = field.decode().rsplit(':', 2)
+
+        stats.setdefault(node, {}).setdefault(scope, {'admitted': 0, 'shed': 0})[outcome] = int(count)
+
+    return stats
+
+
+def reset_published_stats():
+
+    get_redis(STATS_KEY).delete(STATS_KEY)
+
+
+def get_controller(scope):
+
+    """Returns the controller configured in AUTH_ADMISSION_CONTROL for a scope, if any."""
+
+    controller = _controllers.get(scope)
+
+    if controller is not None:
+
+        return controller
+
+    config = getattr(settings, 'AUTH_ADMISSION_CONTROL', {}).get(scope)
+
+    if not config:
+
+        return None
+
+    with _controllers_lock:
+
+        if scope not in _controllers:
+
+            _controllers[scope] = AdmissionController(
+                scope,
+                worker_limit=config['WORKER_LIMIT'],
+                node_limit=config.get('NODE_LIMIT'),
+                queue_timeout=config.get('QUEUE_TIMEOUT', 0),
+                retry_after=config.get('RETRY_AFTER', 1),
+            )
+
+        return _controllers[scope]
+
+
+class AdmissionControlMixin:
+
+    """
+    View mixin limiting concurrency of an endpoint.
+
+    Set `admission_scope` to a key of AUTH_ADMISSION_CONTROL. Saturated
+    requests are answered early with 503 and a Retry-After header.
+    """
+
+    admission_scope = None
+
+    admission_ticket = None
+
+    def initial(self, request, *args, **kwargs):
+
+        super().initial(request, *args, **kwargs)
+
+        controller = get_controller(self.admission_scope)
+
+        if controller is not None:
+
+            self.admission_ticket = controller.admit()
+
+    def dispatch(self, request, *args, **kwargs):
+
+        try:
+
+            return super().dispatch(request, *args, **kwargs)
+
+        finally:
+
+            if self.admission_ticket is not None:
+
+                self.admission_ticket.release()
+
+                self.admission_ticket = None
@@ -1,6 +1,19 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class AuthsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'auths'
+
+    def ready(self):
+
+        from auths import signals  # noqa: F401
+
+        # Servers that fork workers after loading the app should call
+        # auths.warmup.warm_up from a post-fork hook instead (see gunicorn.conf.py).
+        if settings.AUTH_WARMUP_ON_READY:
+
+            from auths.warmup import warm_up
+
+            warm_up()
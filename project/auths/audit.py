@@ -0,0 +1,145 @@
+import atexit
+import logging
+import os
+import threading
+from collections import deque
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+
+from auths.models import AuthEvent
+
+
+logger = logging.getLogger(__name__)
+
+
+class AuditBuffer:
+
+    """
+    In-process buffer of AuthEvent rows.
+
+    Events are appended from request threads and written by a background
+    thread with one bulk_create every `flush_interval` seconds, or as soon as
+    `batch_size` events are waiting. When the database is unavailable the
+    oldest events are dropped once `max_size` is reached, so the buffer never
+    grows without bound.
+    """
+
+    def __init__(self, flush_interval, batch_size, max_size):
+
+        self.flush_interval = flush_interval
+
+        self.batch_size = batch_size
+
+        self.events = deque(maxlen=max_size)
+
+        self.wakeup = threading.Event()
+
+        self.lock = threading.Lock()
+
+        self.thread = None
+
+        self.pid = None
+
+    def record(self, event):
+
+        self.ensure_flusher()
+
+        self.events.append(event)
+
+        if len(self.events) >= self.batch_size:
+
+            self.wakeup.set()
+
+    def ensure_flusher(self):
+
+        # A forked worker does not inherit the parent's thread, start its own.
+        if self.pid == os.getpid() and self.thread.is_alive():
+
+            return
+
+        with self.lock:
+
+            if self.pid == os.getpid() and self.thread.is_alive():
+
+                return
+
+            self.thread = threading.Thread(target=self.run, name='auth-audit-flusher', daemon=True)
+
+            self.pid = os.getpid()
+
+            self.thread.start()
+
+    def run(self):
+
+        while True:
+
+            self.wakeup.wait(self.flush_interval)
+
+            self.wakeup.clear()
+
+            close_old_connections()
+
+            self.flush()
+
+    def drain(self):
+
+        batch = []
+
+        while self.events and len(batch) < self.batch_size:
+
+            batch.append(self.events.popleft())
+
+        return batch
+
+    def flush(self):
+
+        """Writes every buffered event, one bulk_create per batch."""
+
+        batch = self.drain()
+
+        while batch:
+
+            try:
+
+                AuthEvent.objects.bulk_create(batch)
+
+            except Exception:
+
+                logger.exception('Failed to write %d auth events, dropping them', len(batch))
+
+            batch = self.drain()
+
+
+buffer = AuditBuffer(
+    flush_interval=settings.AUTH_AUDIT_FLUSH_INTERVAL,
+    batch_size=settings.AUTH_AUDIT_BATCH_SIZE,
+    max_size=settings.AUTH_AUDIT_BUFFER_SIZE,
+)
+
+atexit.register(buffer.flush)
+
+
+def record_event(event, request=None, user_id=None, identifier=''):
+
+    """Queues an AuthEvent for the next batched write."""
+
+    ip_address = None
+
+    user_agent = ''
+
+    if request is not None:
+
+        ip_address = request.META.get('REMOTE_ADDR') or None
+
+        user_agent = request.META.get('HTTP_USER_AGENT', '')[:255]
+
+    buffer.record(AuthEvent(
+        event=event,
+        user_id=user_id,
+        identifier=str(identifier or '')[:254],
+        ip_address=ip_address,
+        user_agent=user_agent,
+        created_at=timezone.now(),
+    ))
@@ -0,0 +1,94 @@
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from rest_framework_simplejwt.settings import api_settings
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import router
+from django.db.models import F
+
+from auths.models import ProjectUser
+
+
+def get_token_version_key(user_id):
+
+    return f'auth:token_version:{user_id}'
+
+
+def get_token_version(user_id):
+
+    """
+    Returns the current token version of a user, None if the user does not exist.
+
+    Served from Redis, ProjectUser.token_version is only read on a cache miss.
+    The miss reads the primary, as a lagging replica may not have the last
+    bump yet, and fills the cache with add(): if a bump_token_version ran
+    meanwhile, its value stays and this possibly stale one is dropped.
+    """
+
+    key = get_token_version_key(user_id)
+
+    version = cache.get(key)
+
+    if version is None:
+
+        version = (
+            ProjectUser.objects
+            .using(router.db_for_write(ProjectUser))
+            .filter(pk=user_id)
+            .values_list('token_version', flat=True)
+            .first()
+        )
+
+        if version is None:
+
+            return None
+
+        if not cache.add(key, version, timeout=settings.TOKEN_VERSION_CACHE_TTL):
+
+            version = cache.get(key, version)
+
+    return version
+
+
+def bump_token_version(user_id):
+
+    """Invalidates every token issued to a user so far, whatever their number."""
+
+    ProjectUser.objects.filter(pk=user_id).update(token_version=F('token_version') + 1)
+
+    version = ProjectUser.objects.filter(pk=user_id).values_list('token_version', flat=True).first()
+
+    cache.set(get_token_version_key(user_id), version, timeout=settings.TOKEN_VERSION_CACHE_TTL)
+
+    return version
+
+
+def check_token_version(payload):
+
+    """Raises TokenError unless the token was issued for the user's current token version."""
+
+    version = get_token_version(payload.get(api_settings.USER_ID_CLAIM))
+
+    if version is None or payload.get(settings.AUTH_TOKEN_VERSION_CLAIM, 0) != version:
+
+        raise TokenError('Token has been revoked')
+
+
+class VersionedJWTAuthentication(JWTAuthentication):
+
+    """JWTAuthentication that also rejects tokens issued before the user's last token version bump."""
+
+    def get_validated_token(self, raw_token):
+
+        validated_token = super().get_validated_token(raw_token)
+
+        try:
+
+            check_token_version(validated_token.payload)
+
+        except TokenError as e:
+
+            raise InvalidToken({'detail': str(e)})
+
+        return validated_token
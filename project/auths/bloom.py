@@ -0,0 +1,201 @@
+import hashlib
+import logging
+import math
+import uuid
+
+from django.conf import settings
+
+from auths.cache import get_redis
+from auths.models import ProjectUser
+
+
+logger = logging.getLogger(__name__)
+
+# Fields whose values are kept in the identity filter.
+IDENTITY_FIELDS = ['nickname', 'email']
+
+
+class BloomFilter:
+
+    """
+    Bloom filter stored as a Redis bitmap.
+
+    `might_contain` never gives a false negative for a value that was added,
+    and gives a false positive for about `error_rate` of the other values.
+    Sizing follows the usual formulas for `capacity` expected values; the
+    bit positions come from one blake2b digest split in two halves
+    (Kirsch-Mitzenmacher double hashing).
+    """
+
+    def __init__(self, key, capacity, error_rate):
+
+        self.key = key
+
+        self.size = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+
+    def offsets(self, value):
+
+        digest = hashlib.blake2b(value.encode(), digest_size=16).digest()
+
+        first = int.from_bytes(digest[:8], 'big')
+
+        second = int.from_bytes(digest[8:], 'big') | 1
+
+        return [(first + i * second) % self.size for i in range(self.hashes)]
+
+    def add(self, *values):
+
+        pipe = get_redis(self.key).pipeline(transaction=False)
+
+        for value in values:
+
+            for offset in self.offsets(value):
+
+                pipe.setbit(self.key, offset, 1)
+
+        pipe.execute()
+
+    def might_contain(self, value):
+
+        """False only if the value was never added. A missing filter contains everything."""
+
+        pipe = get_redis(self.key).pipeline(transaction=False)
+
+        pipe.exists(self.key)
+
+        for offset in self.offsets(value):
+
+            pipe.getbit(self.key, offset)
+
+        exists, *bits = pipe.execute()
+
+        return not exists or all(bits)
+
+    def rebuild(self, values):
+
+        """
+        Replaces the filter with one holding exactly `values`.
+
+        The bitmap is built in memory and swapped in with a single RENAME,
+        so readers never see a partially built filter.
+        """
+
+        bitmap = bytearray((self.size + 7) // 8)
+
+        count = 0
+
+        for value in values:
+
+            # SETBIT numbers bits from the most significant bit of each byte.
+            for offset in self.offsets(value):
+
+                bitmap[offset >> 3] |= 0x80 >> (offset & 7)
+
+            count += 1
+
+        redis = get_redis(self.key)
+
+        # Shares the hash tag of the key, RENAME needs both on one node.
+        building_key = f'{self.key}:building:{uuid.uuid4().hex}'
+
+        redis.set(building_key, bytes(bitmap))
+
+        redis.rename(building_key, self.key)
+
+        return count
+
+
+identities = BloomFilter(
+    key='auth:bloom:{identities}',
+    capacity=settings.AVAILABILITY_BLOOM_CAPACITY * len(IDENTITY_FIELDS),
+    error_rate=settings.AVAILABILITY_BLOOM_ERROR_RATE,
+)
+
+
+def identity(field, value):
+
+    return f'{field}:{value}'
+
+
+def add_user(user):
+
+    """Adds the nickname and email of a user to the filter. Never raises."""
+
+    try:
+
+        identities.add(*[identity(field, getattr(user, field)) for field in IDENTITY_FIELDS])
+
+    except Exception:
+
+        logger.exception('Failed to add user %s to the identity filter', user.pk)
+
+
+def is_taken(field, value):
+
+    """
+    Whether a user with this nickname or email exists.
+
+    Values the filter has never seen are answered without a query; possible
+    hits, and any Redis failure, fall back to an indexed exists() lookup.
+    """
+
+    try:
+
+        if not identities.might_contain(identity(field, value)):
+
+            return False
+
+    except Exception:
+
+        logger.exception('Identity filter unavailable, checking %s in the database', field)
+
+    return ProjectUser.objects.filter(**{field: value}).exists()
+
+
+def rebuild(batch_size=5000):
+
+    """
+    Rebuilds the filter from ProjectUser and returns the number of users added.
+
+    Users created while the rebuild runs went into the old bitmap, so they
+    are added again once the new one is in place.
+    """
+
+    last_id = 0
+
+    def iter_identities():
+
+        nonlocal last_id
+
+        while True:
+
+            rows = list(
+                ProjectUser.objects
+                .filter(id__gt=last_id)
+                .order_by('id')
+                .values_list('id', *IDENTITY_FIELDS)[:batch_size]
+            )
+
+            if not rows:
+
+                return
+
+            for user_id, *values in rows:
+
+                for field, value in zip(IDENTITY_FIELDS, values):
+
+                    yield identity(field, value)
+
+            last_id = rows[-1][0]
+
+    added = identities.rebuild(iter_identities()) // len(IDENTITY_FIELDS)
+
+    for user in ProjectUser.objects.filter(id__gt=last_id).only('id', *IDENTITY_FIELDS).iterator():
+
+        add_user(user)
+
+        added += 1
+
+    return added
@@ -0,0 +1,114 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import router
+from django.db.models import F
+
+from auths.authentication import get_token_version_key
+from auths.models import ProjectUser
+from auths.sockets import revoke_user_sockets
+
+
+def select_users(ids=None, email_domain=None, filters=None):
+
+    """Builds the ProjectUser queryset targeted by a bulk operation."""
+
+    queryset = ProjectUser.objects.all()
+
+    if ids is not None:
+
+        queryset = queryset.filter(id__in=ids)
+
+    if email_domain:
+
+        queryset = queryset.filter(email__iendswith=f"@{email_domain.lstrip('@')}")
+
+    if filters:
+
+        queryset = queryset.filter(**filters)
+
+    return queryset
+
+
+def iter_id_chunks(queryset, chunk_size):
+
+    """Yields lists of ids of `queryset`, walking the primary key so no chunk is loaded twice."""
+
+    last_id = 0
+
+    while True:
+
+        ids = list(
+            queryset
+            .filter(id__gt=last_id)
+            .order_by('id')
+            .values_list('id', flat=True)[:chunk_size]
+        )
+
+        if not ids:
+
+            return
+
+        yield ids
+
+        last_id = ids[-1]
+
+
+def cache_token_versions(ids):
+
+    """Pushes the token versions of `ids` to Redis in one pipeline."""
+
+    rows = (
+        ProjectUser.objects
+        .using(router.db_for_write(ProjectUser))
+        .filter(id__in=ids)
+        .values_list('id', 'token_version')
+    )
+
+    cache.set_many(
+        {get_token_version_key(user_id): version for user_id, version in rows},
+        timeout=settings.TOKEN_VERSION_CACHE_TTL
+    )
+
+
+def bulk_update(queryset, chunk_size, progress=None, **updates):
+
+    """
+    Applies `updates` and a token version bump to every user of `queryset`.
+
+    Runs one UPDATE per chunk of ids followed by one Redis pipeline and one
+    broadcast closing the chunk's open WebSockets, so memory stays bounded
+    by the chunk size whatever the number of users. Returns the number of
+    users processed.
+    """
+
+    processed = 0
+
+    for ids in iter_id_chunks(queryset, chunk_size):
+
+        ProjectUser.objects.filter(id__in=ids).update(token_version=F('token_version') + 1, **updates)
+
+        cache_token_versions(ids)
+
+        revoke_user_sockets(*ids)
+
+        processed += len(ids)
+
+        if progress is not None:
+
+            progress(processed)
+
+    return processed
+
+
+def force_logout_users(queryset, chunk_size=1000, progress=None):
+
+    """Invalidates every token issued to the users of `queryset`."""
+
+    return bulk_update(queryset, chunk_size, progress)
+
+
+def deactivate_users(queryset, chunk_size=1000, progress=None):
+
+    """Deactivates the users of `queryset` and invalidates their tokens."""
+
+    return bulk_update(queryset, chunk_size, progress, is_active=False)
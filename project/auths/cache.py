@@ -0,0 +1,253 @@
+import bisect
+import hashlib
+from collections import defaultdict
+
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django_redis import get_redis_connection
+from django_redis.client import DefaultClient, ShardClient
+from django_redis.client.default import DEFAULT_TIMEOUT
+from django_redis.util import CacheKey
+
+
+def hash_tag(key):
+
+    """
+    Part of a key that decides its shard, as in Redis Cluster.
+
+    Keys sharing a non-empty `{...}` section hash by that section alone, so
+    they land on one node and can be used together in one pipeline, script,
+    RENAME or ZUNIONSTORE.
+    """
+
+    start = key.find('{')
+
+    if start != -1:
+
+        end = key.find('}', start + 1)
+
+        if end > start + 1:
+
+            return key[start + 1:end]
+
+    return key
+
+
+class HashRing:
+
+    """
+    Consistent hash ring with `replicas` virtual nodes per node.
+
+    Adding a node to a ring of n nodes moves about 1/(n + 1) of the keys,
+    all of them to the new node; the virtual nodes keep the share of each
+    node within a few percent of even.
+    """
+
+    def __init__(self, nodes=(), replicas=160):
+
+        self.replicas = replicas
+
+        self.points = []
+
+        self.owners = {}
+
+        for node in nodes:
+
+            self.add_node(node)
+
+    @staticmethod
+    def hash(value):
+
+        return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), 'big')
+
+    def add_node(self, node):
+
+        for replica in range(self.replicas):
+
+            point = self.hash(f'{node}#{replica}')
+
+            self.owners[point] = node
+
+            bisect.insort(self.points, point)
+
+    def remove_node(self, node):
+
+        for replica in range(self.replicas):
+
+            point = self.hash(f'{node}#{replica}')
+
+            del self.owners[point]
+
+            self.points.remove(point)
+
+    def get_node(self, key):
+
+        """Node owning the first point clockwise of the key's hash."""
+
+        if not self.points:
+
+            return None
+
+        index = bisect.bisect(self.points, self.hash(key)) % len(self.points)
+
+        return self.owners[self.points[index]]
+
+
+class ShardedRedisClient(ShardClient):
+
+    """
+    django-redis client spreading keys over several Redis nodes.
+
+    LOCATION lists the nodes of the default pool. OPTIONS['POOLS'] maps
+    further pool names to node lists and OPTIONS['NAMESPACES'] maps key
+    prefixes to pools, so e.g. verification codes and revocations can live
+    on nodes of their own; a pool without nodes falls back to the default
+    one. Within a pool a key goes to its node on a consistent hash ring of
+    its hash tag. Multi-key operations run one pipeline per node.
+
+    Namespaces are matched against the key as the application wrote it,
+    which assumes django-redis's default KEY_FUNCTION.
+    """
+
+    def __init__(self, server, params, backend):
+
+        DefaultClient.__init__(self, server, params, backend)
+
+        replicas = self._options.get('REPLICAS', 160)
+
+        self._pools = {'default': HashRing(self._server, replicas)}
+
+        for name, nodes in self._options.get('POOLS', {}).items():
+
+            if nodes:
+
+                self._pools[name] = HashRing(nodes, replicas)
+
+        self._namespaces = []
+
+        for prefix, pool in self._options.get('NAMESPACES', {}).items():
+
+            if pool not in self._pools and pool not in self._options.get('POOLS', {}):
+
+                raise ImproperlyConfigured(f'Cache namespace {prefix!r} uses unknown pool {pool!r}')
+
+            self._namespaces.append((prefix, pool if pool in self._pools else 'default'))
+
+        # Longest prefix first, so a namespace can carve a part out of another.
+        self._namespaces.sort(key=lambda namespace: len(namespace[0]), reverse=True)
+
+        self._server = sorted({node for ring in self._pools.values() for node in ring.owners.values()})
+
+        self._serverdict = self.connect()
+
+    def get_pool(self, key):
+
+        for prefix, pool in self._namespaces:
+
+            if key.startswith(prefix):
+
+                return self._pools[pool]
+
+        return self._pools['default']
+
+    def route(self, key):
+
+        """Node of a key as the application wrote it, without prefix and version."""
+
+        return self.get_pool(key).get_node(hash_tag(key))
+
+    def get_ring(self, pool):
+
+        """Ring of a pool from OPTIONS['POOLS'], or of the default pool. None for a pool without nodes."""
+
+        return self._pools.get(pool)
+
+    def get_node_client(self, node):
+
+        """Raw Redis client of a node, also of one that is not on any ring yet."""
+
+        if node not in self._serverdict:
+
+            self._serverdict[node] = self.connection_factory.connect(node)
+
+        return self._serverdict[node]
+
+    def get_application_key(self, stored_key):
+
+        """Key as the application wrote it, for a key as stored in Redis."""
+
+        # Written through the cache API as 'prefix:version:key', raw keys are stored as is.
+        prefix, _, rest = stored_key.partition(':')
+
+        version, separator, key = rest.partition(':')
+
+        if separator and prefix == self._backend.key_prefix and version.isdigit():
+
+            return key
+
+        return stored_key
+
+    def get_server_name(self, key):
+
+        # Cache keys arrive as 'prefix:version:key'.
+        if isinstance(key, CacheKey):
+
+            key = str(key).split(':', 2)[-1]
+
+        return self.route(str(key))
+
+    def group_by_server(self, keys):
+
+        groups = defaultdict(list)
+
+        for key in keys:
+
+            groups[self.get_server_name(key)].append(key)
+
+        return groups
+
+    def get_many(self, keys, version=None):
+
+        recovered_data = {}
+
+        for name, group in self.group_by_server(keys).items():
+
+            recovered_data.update(DefaultClient.get_many(self, group, version=version, client=self._serverdict[name]))
+
+        return {key: recovered_data[key] for key in keys if key in recovered_data}
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+
+        for name, group in self.group_by_server(data).items():
+
+            DefaultClient.set_many(
+                self, {key: data[key] for key in group}, timeout, version=version, client=self._serverdict[name]
+            )
+
+    def delete_many(self, keys, version=None):
+
+        deleted = 0
+
+        for name, group in self.group_by_server(keys).items():
+
+            deleted += DefaultClient.delete_many(self, group, version=version, client=self._serverdict[name]) or 0
+
+        return deleted
+
+
+def get_redis(key, alias='default'):
+
+    """
+    Raw Redis client of the node holding `key`.
+
+    Use it instead of get_redis_connection for keys touched outside the
+    cache API. Every key of one pipeline or script must share a hash tag.
+    """
+
+    client = caches[alias].client
+
+    if isinstance(client, ShardedRedisClient):
+
+        return client.get_server(key)
+
+    return get_redis_connection(alias)
@@ -0,0 +1,70 @@
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+
+from auths.sockets import get_session_group, get_user_group
+
+
+# Close code sent to unauthenticated or revoked connections.
+CLOSE_UNAUTHORIZED = 4401
+
+
+class AuthenticatedConsumerMixin:
+
+    """
+    Accepts only connections authenticated by CookieTokenAuthMiddleware and
+    closes them when revoke_user_sockets is called for their user or
+    revoke_session_sockets for their session.
+    """
+
+    async def connect(self):
+
+        user_id = self.scope.get('user_id')
+
+        if user_id is None:
+
+            await self.close(code=CLOSE_UNAUTHORIZED)
+
+            return
+
+        self.user_group = get_user_group(user_id)
+
+        # Logout of one device closes only its sockets, through the session group.
+        self.auth_groups = [self.user_group]
+
+        if self.scope.get('session_id'):
+
+            self.auth_groups.append(get_session_group(self.scope['session_id']))
+
+        for group in self.auth_groups:
+
+            await self.channel_layer.group_add(group, self.channel_name)
+
+        await self.accept()
+
+    async def disconnect(self, code):
+
+        for group in getattr(self, 'auth_groups', []):
+
+            await self.channel_layer.group_discard(group, self.channel_name)
+
+    async def auth_revoke(self, event):
+
+        await self.close(code=CLOSE_UNAUTHORIZED)
+
+
+class SessionConsumer(AuthenticatedConsumerMixin, AsyncJsonWebsocketConsumer):
+
+    """Authenticated socket of a signed-in browser session; answers pings."""
+
+    async def connect(self):
+
+        await super().connect()
+
+        if getattr(self, 'user_group', None):
+
+            await self.send_json({'type': 'session', 'user_id': self.scope['user_id']})
+
+    async def receive_json(self, content, **kwargs):
+
+        if content.get('type') == 'ping':
+
+            await self.send_json({'type': 'pong'})
@@ -0,0 +1,39 @@
+from django.conf import settings
+from django.contrib.auth import hashers
+
+
+class ConfiguredParamsMixin:
+
+    """
+    Takes the cost parameters of a hasher from AUTH_PASSWORD_HASHER_PARAMS[params_key].
+
+    Hashes stored with other parameters still verify, and Django's
+    must_update makes check_password rehash them on the next login.
+    """
+
+    params_key = None
+
+    def __init__(self):
+
+        for name, value in settings.AUTH_PASSWORD_HASHER_PARAMS[self.params_key].items():
+
+            setattr(self, name, value)
+
+
+class PBKDF2PasswordHasher(ConfiguredParamsMixin, hashers.PBKDF2PasswordHasher):
+
+    params_key = 'pbkdf2'
+
+
+class ScryptPasswordHasher(ConfiguredParamsMixin, hashers.ScryptPasswordHasher):
+
+    params_key = 'scrypt'
+
+    # hashlib's default limit of 32 MiB rejects larger work factors, and stored
+    # hashes may use larger ones than the current settings. Allow up to 1 GiB.
+    maxmem = 1024 ** 3
+
+
+class Argon2PasswordHasher(ConfiguredParamsMixin, hashers.Argon2PasswordHasher):
+
+    params_key = 'argon2'
@@ -0,0 +1,146 @@
+import hashlib
+import time
+
+from rest_framework import status
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse, JsonResponse
+
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+
+MAX_KEY_LENGTH = 255
+
+# Outcomes that are not final: a retry with the same key must run the view
+# again instead of getting them back, e.g. once a throttle's Retry-After passed.
+UNSTORED_STATUSES = frozenset({status.HTTP_409_CONFLICT, status.HTTP_429_TOO_MANY_REQUESTS})
+
+
+class IdempotencyMixin:
+
+    """
+    View mixin adding `Idempotency-Key` header support to POST endpoints.
+
+    The first request with a given key is executed and its rendered response
+    is stored in Redis for IDEMPOTENCY_KEY_TTL seconds, unless it is a server
+    error, 409 or 429. Retries with the same key and body get the stored
+    response back without running the view again.
+    Concurrent duplicates are collapsed with a short lock: they wait for the
+    original to finish and replay its response.
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+
+        if request.method != 'POST' or not key:
+
+            return super().dispatch(request, *args, **kwargs)
+
+        if len(key) > MAX_KEY_LENGTH:
+
+            return JsonResponse(
+                {"errors": {"message": f"{IDEMPOTENCY_HEADER} is too long."}},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        digest = hashlib.sha256(f'{request.path}:{key}'.encode()).hexdigest()
+
+        response_key = f'idempotency:response:{digest}'
+
+        lock_key = f'idempotency:lock:{digest}'
+
+        fingerprint = hashlib.sha256(request.body).hexdigest()
+
+        stored = cache.get(response_key)
+
+        if stored is None:
+
+            if not cache.add(lock_key, fingerprint, timeout=settings.IDEMPOTENCY_LOCK_TIMEOUT):
+
+                stored = self.wait_for_response(response_key)
+
+                if stored is None:
+
+                    return JsonResponse(
+                        {"errors": {"message": "A request with this Idempotency-Key is already in progress."}},
+                        status=status.HTTP_409_CONFLICT
+                    )
+
+            else:
+
+                try:
+
+                    # The original may have stored its response and released the
+                    # lock between the first read and taking the lock.
+                    stored = cache.get(response_key)
+
+                    if stored is None:
+
+                        response = super().dispatch(request, *args, **kwargs)
+
+                        self.store_response(response_key, fingerprint, response)
+
+                        return response
+
+                finally:
+
+                    cache.delete(lock_key)
+
+        if stored['fingerprint'] != fingerprint:
+
+            return JsonResponse(
+                {"errors": {"message": f"{IDEMPOTENCY_HEADER} was already used with a different request."}},
+                status=status.HTTP_422_UNPROCESSABLE_ENTITY
+            )
+
+        return self.replay_response(stored)
+
+    def wait_for_response(self, response_key):
+
+        """Polls for the response of a concurrent duplicate still in progress."""
+
+        deadline = time.monotonic() + settings.IDEMPOTENCY_WAIT_TIMEOUT
+
+        while time.monotonic() < deadline:
+
+            time.sleep(settings.IDEMPOTENCY_POLL_INTERVAL)
+
+            stored = cache.get(response_key)
+
+            if stored is not None:
+
+                return stored
+
+        return None
+
+    def store_response(self, response_key, fingerprint, response):
+
+        # Only final outcomes are stored, server errors and throttling are not.
+        if response.status_code >= 500 or response.status_code in UNSTORED_STATUSES:
+
+            return
+
+        if hasattr(response, 'render'):
+
+            response.render()
+
+        cache.set(response_key, {
+            'fingerprint': fingerprint,
+            'status': response.status_code,
+            'content': response.content,
+            'content_type': response.get('Content-Type'),
+        }, timeout=settings.IDEMPOTENCY_KEY_TTL)
+
+    def replay_response(self, stored):
+
+        response = HttpResponse(
+            stored['content'],
+            status=stored['status'],
+            content_type=stored['content_type']
+        )
+
+        response['Idempotent-Replayed'] = 'true'
+
+        return response
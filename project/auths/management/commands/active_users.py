@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from auths import activity
+
+
+class Command(BaseCommand):
+
+    help = 'Reports users active in a time window, served from Redis.'
+
+    def add_arguments(self, parser):
+
+        parser.add_argument('--window', type=int, default=300, help='Window in seconds.')
+
+        parser.add_argument('--list', type=int, default=0, help='Also list up to this many user ids.')
+
+    def handle(self, *args, **options):
+
+        self.stdout.write(f"{activity.active_user_count(options['window'])} users active in the last {options['window']}s")
+
+        if options['list']:
+
+            for user_id in activity.active_user_ids(options['window'], limit=options['list']):
+
+                self.stdout.write(str(user_id))
@@ -0,0 +1,57 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from auths import admission
+
+
+class Command(BaseCommand):
+
+    help = (
+        'Reports admitted and shed requests of the admission controlled endpoints, '
+        'summed over every worker that published its counters to Redis.'
+    )
+
+    def add_arguments(self, parser):
+
+        parser.add_argument('--reset', action='store_true', help='Clear the published counters afterwards.')
+
+    def handle(self, *args, **options):
+
+        stats = admission.published_stats()
+
+        self.stdout.write(
+            f'Counters lag the workers by up to {settings.AUTH_ADMISSION_STATS_INTERVAL}s.'
+        )
+        self.stdout.write(f"{'node':<24} {'scope':<20} {'admitted':>10} {'shed':>10} {'shed %':>7}")
+
+        totals = {}
+
+        for node, scopes in sorted(stats.items()):
+
+            for scope, counts in sorted(scopes.items()):
+
+                self.write_row(node, scope, counts)
+
+                total = totals.setdefault(scope, {'admitted': 0, 'shed': 0})
+
+                total['admitted'] += counts['admitted']
+
+                total['shed'] += counts['shed']
+
+        if len(stats) > 1:
+
+            for scope, counts in sorted(totals.items()):
+
+                self.write_row('all nodes', scope, counts)
+
+        if options['reset']:
+
+            admission.reset_published_stats()
+
+    def write_row(self, node, scope, counts):
+
+        requests = counts['admitted'] + counts['shed']
+
+        shed_share = counts['shed'] / requests * 100 if requests else 0
+
+        self.stdout.write(f"{node:<24} {scope:<20} {counts['admitted']:>10} {counts['shed']:>10} {shed_share:>6.1f}%")
@@ -0,0 +1,61 @@
+import timeit
+
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from auths.models import ProjectUser
+from auths.tokens import get_minter
+
+
+class Command(BaseCommand):
+
+    help = 'Compares token minting of auths.tokens with simplejwt for login and refresh.'
+
+    def add_arguments(self, parser):
+
+        parser.add_argument('--iterations', type=int, default=10000, help='Tokens minted per case.')
+
+        parser.add_argument('--repeat', type=int, default=5, help='Runs per case, the fastest one is reported.')
+
+    def handle(self, *args, **options):
+
+        # Minting never touches the database, an unsaved user is enough.
+        user = ProjectUser(pk=1, nickname='benchmark', token_version=0)
+
+        version_claim = settings.AUTH_TOKEN_VERSION_CLAIM
+
+        minter = get_minter()
+
+        refresh_token, _, _ = minter.mint_pair(user, **{version_claim: 0})
+
+        def simplejwt_login():
+
+            refresh = RefreshToken.for_user(user)
+
+            refresh[version_claim] = user.token_version
+
+            return str(refresh), str(refresh.access_token)
+
+        def simplejwt_refresh():
+
+            return str(RefreshToken(refresh_token).access_token)
+
+        # Refresh includes decoding the refresh token, as TokenRefreshService does.
+        cases = [
+            ('login', simplejwt_login, lambda: minter.mint_pair(user, **{version_claim: user.token_version})),
+            ('refresh', simplejwt_refresh, lambda: minter.mint_access(RefreshToken(refresh_token).payload)),
+        ]
+
+        iterations = options['iterations']
+
+        self.stdout.write(f"{'case':<20} {'simplejwt [us]':>15} {'auths.tokens [us]':>18} {'speedup':>8}")
+
+        for name, baseline, fast_path in cases:
+
+            baseline_us = min(timeit.repeat(baseline, number=iterations, repeat=options['repeat'])) / iterations * 1e6
+
+            fast_path_us = min(timeit.repeat(fast_path, number=iterations, repeat=options['repeat'])) / iterations * 1e6
+
+            self.stdout.write(f'{name:<20} {baseline_us:>15.1f} {fast_path_us:>18.1f} {baseline_us / fast_path_us:>7.1f}x')
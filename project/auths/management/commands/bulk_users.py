@@ -0,0 +1,81 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from auths.bulk import deactivate_users, force_logout_users, select_users
+
+
+ACTIONS = {
+    'deactivate': deactivate_users,
+    'force-logout': force_logout_users,
+}
+
+
+class Command(BaseCommand):
+
+    help = 'Deactivates or force-logs-out users selected by id list, email domain or filter, in chunks.'
+
+    def add_arguments(self, parser):
+
+        parser.add_argument('action', choices=ACTIONS)
+
+        parser.add_argument('--ids', help='Comma separated user ids.')
+
+        parser.add_argument('--ids-file', help='File with one user id per line.')
+
+        parser.add_argument('--email-domain', help='Select users whose email is in this domain.')
+
+        parser.add_argument(
+            '--filter',
+            help='JSON object of queryset lookups, e.g. \'{"last_login__lt": "2024-01-01"}\'.'
+        )
+
+        parser.add_argument('--chunk-size', type=int, default=1000)
+
+        parser.add_argument('--dry-run', action='store_true', help='Only count the selected users.')
+
+    def handle(self, *args, **options):
+
+        ids = None
+
+        if options['ids']:
+
+            ids = [int(user_id) for user_id in options['ids'].split(',') if user_id.strip()]
+
+        if options['ids_file']:
+
+            with open(options['ids_file']) as ids_file:
+
+                ids = (ids or []) + [int(line) for line in ids_file if line.strip()]
+
+        filters = None
+
+        if options['filter']:
+
+            try:
+
+                filters = json.loads(options['filter'])
+
+            except ValueError as e:
+
+                raise CommandError(f'Invalid --filter: {e}')
+
+        if ids is None and not options['email_domain'] and not filters:
+
+            raise CommandError('Select users with --ids, --ids-file, --email-domain or --filter.')
+
+        queryset = select_users(ids=ids, email_domain=options['email_domain'], filters=filters)
+
+        if options['dry_run']:
+
+            self.stdout.write(f'{queryset.count()} users selected.')
+
+            return
+
+        processed = ACTIONS[options['action']](
+            queryset,
+            chunk_size=options['chunk_size'],
+            progress=lambda count: self.stdout.write(f'{count} users processed...'),
+        )
+
+        self.stdout.write(self.style.SUCCESS(f"{options['action']}: {processed} users done."))
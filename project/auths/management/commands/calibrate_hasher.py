@@ -0,0 +1,116 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.crypto import get_random_string
+from django.utils.module_loading import import_string
+
+
+class Command(BaseCommand):
+
+    help = (
+        'Measures password hashing on this machine and recommends cost parameters '
+        'that keep one hash within a latency budget.'
+    )
+
+    def add_arguments(self, parser):
+
+        parser.add_argument(
+            '--hasher',
+            choices=list(settings.AUTH_PASSWORD_HASHER_CLASSES),
+            default=settings.AUTH_PASSWORD_HASHER,
+            help='Hasher to calibrate, the configured one by default.'
+        )
+
+        parser.add_argument('--target-ms', type=float, default=250, help='Latency budget of one hash on one core.')
+
+        parser.add_argument('--samples', type=int, default=5, help='Hashes timed per measurement, the fastest counts.')
+
+    def handle(self, *args, **options):
+
+        name = options['hasher']
+
+        hasher = import_string(settings.AUTH_PASSWORD_HASHER_CLASSES[name])()
+
+        self.samples = options['samples']
+
+        target = options['target_ms']
+
+        current = {param: getattr(hasher, param) for param in settings.AUTH_PASSWORD_HASHER_PARAMS[name]}
+
+        try:
+
+            current_ms = self.measure(hasher, current)
+
+        except ValueError as e:
+
+            raise CommandError(f'{name} is not usable here: {e}')
+
+        self.stdout.write(f'Hasher: {name}, budget {target:.0f} ms per hash')
+        self.stdout.write(f'Configured {self.format(current)}: {current_ms:.1f} ms')
+
+        recommended = getattr(self, f'calibrate_{name}')(hasher, current, target)
+
+        self.stdout.write(f'Recommended {self.format(recommended)}: {self.measure(hasher, recommended):.1f} ms')
+        self.stdout.write('')
+
+        for param, value in recommended.items():
+
+            self.stdout.write(f'AUTH_{name.upper()}_{param.upper()}={value}')
+
+    def measure(self, hasher, params):
+
+        """Milliseconds of the fastest of `samples` hashes with the given parameters."""
+
+        for param, value in params.items():
+
+            setattr(hasher, param, value)
+
+        timings = []
+
+        for _ in range(self.samples):
+
+            salt = hasher.salt()
+
+            started = time.perf_counter()
+
+            hasher.encode(get_random_string(16), salt)
+
+            timings.append((time.perf_counter() - started) * 1000)
+
+        return min(timings)
+
+    def calibrate_pbkdf2(self, hasher, current, target):
+
+        # PBKDF2 is linear in its iterations.
+        probe = {'iterations': 100000}
+
+        iterations = int(target / self.measure(hasher, probe) * probe['iterations'])
+
+        return {'iterations': max(iterations // 10000 * 10000, 10000)}
+
+    def calibrate_scrypt(self, hasher, current, target):
+
+        # Work factors are powers of two; take the largest within the budget.
+        params = {**current, 'work_factor': 2 ** 10}
+
+        while self.measure(hasher, {**params, 'work_factor': params['work_factor'] * 2}) <= target:
+
+            params['work_factor'] *= 2
+
+        return params
+
+    def calibrate_argon2(self, hasher, current, target):
+
+        # Memory cost and parallelism stay as configured, time cost fills the budget.
+        params = {**current, 'time_cost': 1}
+
+        while self.measure(hasher, {**params, 'time_cost': params['time_cost'] + 1}) <= target:
+
+            params['time_cost'] += 1
+
+        return params
+
+    def format(self, params):
+
+        return ', '.join(f'{param}={value}' for param, value in params.items())
@@ -0,0 +1,33 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from auths import activity
+
+
+class Command(BaseCommand):
+
+    help = 'Writes activity recorded in Redis to ProjectUser.last_login in batched UPDATEs.'
+
+    def add_arguments(self, parser):
+
+        parser.add_argument('--batch-size', type=int, default=settings.LAST_SEEN_FLUSH_BATCH_SIZE)
+
+        parser.add_argument('--loop', action='store_true', help='Keep flushing every --interval seconds.')
+
+        parser.add_argument('--interval', type=float, default=settings.LAST_SEEN_FLUSH_INTERVAL)
+
+    def handle(self, *args, **options):
+
+        while True:
+
+            written = activity.flush(batch_size=options['batch_size'])
+
+            self.stdout.write(f'Updated last_login of {written} users.')
+
+            if not options['loop']:
+
+                break
+
+            time.sleep(options['interval'])
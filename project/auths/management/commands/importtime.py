@@ -0,0 +1,94 @@
+import os
+import subprocess
+import sys
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+# Imports everything a worker needs before it can serve its first request.
+STARTUP_SCRIPT = """
+import time
+started = time.perf_counter()
+from django.core.wsgi import get_wsgi_application
+get_wsgi_application()
+from django.urls import get_resolver
+get_resolver().url_patterns
+print(round((time.perf_counter() - started) * 1000, 1))
+"""
+
+
+class Command(BaseCommand):
+
+    help = (
+        'Reports import time of a cold worker start for the current settings '
+        '(compare e.g. --settings project.settings and project.settings_auth).'
+    )
+
+    def add_arguments(self, parser):
+
+        parser.add_argument('--limit', type=int, default=25, help='Number of modules to list.')
+
+        parser.add_argument(
+            '--sort',
+            choices=['cumulative', 'self'],
+            default='cumulative',
+            help='Column used to rank modules.'
+        )
+
+    def handle(self, *args, **options):
+
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', STARTUP_SCRIPT],
+            env=os.environ.copy(),
+            capture_output=True,
+            text=True,
+        )
+
+        if result.returncode != 0:
+
+            raise CommandError(result.stderr.strip().splitlines()[-1])
+
+        modules = self.parse(result.stderr)
+
+        column = 1 if options['sort'] == 'self' else 2
+
+        self.stdout.write(f"Settings: {os.environ.get('DJANGO_SETTINGS_MODULE')}")
+        self.stdout.write(f"Startup wall time: {result.stdout.strip()} ms, {len(modules)} modules imported")
+        self.stdout.write('')
+        self.stdout.write(f"{'self [ms]':>10} {'cumulative [ms]':>16}  module")
+
+        for name, self_us, cumulative_us in sorted(modules, key=lambda row: row[column], reverse=True)[:options['limit']]:
+
+            self.stdout.write(f"{self_us / 1000:>10.1f} {cumulative_us / 1000:>16.1f}  {name}")
+
+        packages = defaultdict(int)
+
+        for name, self_us, _ in modules:
+
+            packages[name.split('.')[0]] += self_us
+
+        self.stdout.write('')
+        self.stdout.write(f"{'self [ms]':>10}  top-level package")
+
+        for package, self_us in sorted(packages.items(), key=lambda row: row[1], reverse=True)[:options['limit']]:
+
+            self.stdout.write(f"{self_us / 1000:>10.1f}  {package}")
+
+    def parse(self, output):
+
+        """Parses `-X importtime` lines into (module, self_us, cumulative_us) rows."""
+
+        modules = []
+
+        for line in output.splitlines():
+
+            if not line.startswith('import time:') or 'imported package' in line:
+
+                continue
+
+            self_us, cumulative_us, name = line[len('import time:'):].split('|')
+
+            modules.append((name.strip(), int(self_us), int(cumulative_us)))
+
+        return modules
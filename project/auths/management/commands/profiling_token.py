@@ -0,0 +1,13 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from auths.middleware import make_profiling_token
+
+
+class Command(BaseCommand):
+
+    help = 'Prints a signed header value that makes ProfilingMiddleware profile a request.'
+
+    def handle(self, *args, **options):
+
+        self.stdout.write(f"{settings.PROFILING['HEADER']}: {make_profiling_token()}")
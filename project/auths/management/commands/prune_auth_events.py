@@ -0,0 +1,57 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from auths.models import AuthEvent
+
+
+class Command(BaseCommand):
+
+    help = 'Deletes auth events older than the retention period in small batches.'
+
+    def add_arguments(self, parser):
+
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=settings.AUTH_AUDIT_RETENTION_DAYS,
+            help='Keep events newer than this many days.'
+        )
+
+        parser.add_argument('--batch-size', type=int, default=5000, help='Rows deleted per statement.')
+
+        parser.add_argument('--sleep', type=float, default=0.1, help='Pause between batches, in seconds.')
+
+    def handle(self, *args, **options):
+
+        cutoff = timezone.now() - timedelta(days=options['days'])
+
+        deleted = 0
+
+        while True:
+
+            # Old events sit at the start of the primary key, so this walks
+            # the pk index and stops after one batch.
+            ids = list(
+                AuthEvent.objects
+                .filter(created_at__lt=cutoff)
+                .order_by('id')
+                .values_list('id', flat=True)[:options['batch_size']]
+            )
+
+            if not ids:
+
+                break
+
+            AuthEvent.objects.filter(id__in=ids).delete()
+
+            deleted += len(ids)
+
+            self.stdout.write(f'Deleted {deleted} events...')
+
+            time.sleep(options['sleep'])
+
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} auth events older than {cutoff:%Y-%m-%d %H:%M}.'))
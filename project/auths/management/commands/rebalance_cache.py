@@ -0,0 +1,158 @@
+from django.core.cache import caches
+from django.core.management.base import BaseCommand, CommandError
+
+from auths.cache import HashRing, ShardedRedisClient, hash_tag
+
+
+# Collection types merged member by member into an existing key on the target.
+MERGED_TYPES = (b'zset', b'hash', b'set')
+
+
+class Command(BaseCommand):
+
+    help = (
+        'Copies the keys of a cache pool to the node that owns them on its ring, '
+        'e.g. before and after adding or removing a node.'
+    )
+
+    def add_arguments(self, parser):
+
+        parser.add_argument('--pool', default='default', help='Pool from OPTIONS["POOLS"], or "default".')
+
+        parser.add_argument(
+            '--add', action='append', default=[], metavar='NODE',
+            help='Node to be added, keys are copied to the ring including it. Repeatable.'
+        )
+
+        parser.add_argument(
+            '--remove', action='append', default=[], metavar='NODE',
+            help='Node to be removed, keys are copied to the ring without it. Repeatable.'
+        )
+
+        parser.add_argument('--delete', action='store_true', help='Delete keys from a node once copied to their owner.')
+
+        parser.add_argument('--dry-run', action='store_true', help='Only count the keys that would be copied.')
+
+        parser.add_argument('--alias', default='default', help='Cache alias.')
+
+    def handle(self, *args, **options):
+
+        client = caches[options['alias']].client
+
+        if not isinstance(client, ShardedRedisClient):
+
+            raise CommandError(f"Cache {options['alias']!r} does not use ShardedRedisClient.")
+
+        ring = client.get_ring(options['pool'])
+
+        if ring is None:
+
+            raise CommandError(f"Pool {options['pool']!r} has no nodes of its own, it is part of 'default'.")
+
+        nodes = sorted(set(ring.owners.values()))
+
+        unknown = set(options['remove']) - set(nodes)
+
+        if unknown:
+
+            raise CommandError(f"Not nodes of pool {options['pool']!r}: {', '.join(sorted(unknown))}")
+
+        target = HashRing(sorted(set(nodes) - set(options['remove']) | set(options['add'])), ring.replicas)
+
+        self.client = client
+
+        self.dry_run = options['dry_run']
+
+        for node in sorted(set(nodes) | set(options['add'])):
+
+            scanned, copied = self.rebalance_node(node, ring, target, options['delete'])
+
+            self.stdout.write(f'{node}: {scanned} keys of the pool, {copied} copied to their owner')
+
+    def rebalance_node(self, node, ring, target, delete):
+
+        source = self.client.get_node_client(node)
+
+        scanned = copied = 0
+
+        for stored_key in source.scan_iter(count=1000):
+
+            key = self.client.get_application_key(stored_key.decode())
+
+            # Pools share nodes with the default pool, leave keys of other pools alone.
+            if self.client.get_pool(key) is not ring:
+
+                continue
+
+            scanned += 1
+
+            owner = target.get_node(hash_tag(key))
+
+            if owner == node:
+
+                continue
+
+            copied += 1
+
+            if self.dry_run:
+
+                continue
+
+            copy_key(source, self.client.get_node_client(owner), stored_key)
+
+            if delete:
+
+                source.delete(stored_key)
+
+        return scanned, copied
+
+
+def copy_key(source, target, key):
+
+    """
+    Copies one key between nodes without losing data already on the target.
+
+    The target may hold a newer version of the key, written after the ring
+    switched. Sorted sets, hashes and sets are therefore merged, keeping the
+    target's members, and other keys are only copied when missing. Revoked
+    sessions thus stay revoked whichever node saw the revocation.
+    """
+
+    ttl = source.pttl(key)
+
+    # Expired or deleted meanwhile.
+    if ttl == -2:
+
+        return
+
+    kind = source.type(key)
+
+    if kind not in MERGED_TYPES:
+
+        if not target.exists(key):
+
+            target.restore(key, max(ttl, 0), source.dump(key))
+
+        return
+
+    existed = target.exists(key)
+
+    if kind == b'zset':
+
+        target.zadd(key, dict(source.zrange(key, 0, -1, withscores=True)), nx=True)
+
+    elif kind == b'hash':
+
+        for field, value in source.hgetall(key).items():
+
+            target.hsetnx(key, field, value)
+
+    else:
+
+        target.sadd(key, *source.smembers(key))
+
+    target_ttl = target.pttl(key)
+
+    if ttl > 0 and (not existed or 0 <= target_ttl < ttl):
+
+        target.pexpire(key, ttl)
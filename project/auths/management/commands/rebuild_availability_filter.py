@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from auths import bloom
+
+
+class Command(BaseCommand):
+
+    help = 'Rebuilds the Bloom filter of taken nicknames and emails used by /auth/availability.'
+
+    def add_arguments(self, parser):
+
+        parser.add_argument('--batch-size', type=int, default=5000, help='Users read per query.')
+
+    def handle(self, *args, **options):
+
+        started = time.perf_counter()
+
+        added = bloom.rebuild(batch_size=options['batch_size'])
+
+        filter_ = bloom.identities
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Added {added} users to the identity filter in {time.perf_counter() - started:.1f}s '
+            f'({filter_.size} bits, {filter_.hashes} hashes).'
+        ))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from auths.warmup import warm_up
+
+
+class Command(BaseCommand):
+
+    help = 'Runs the worker warm-up routine and reports how long each step took.'
+
+    def handle(self, *args, **options):
+
+        for step, elapsed_ms in warm_up().items():
+
+            self.stdout.write(f'{step:>15}: {elapsed_ms} ms')
@@ -0,0 +1,292 @@
+import cProfile
+import marshal
+import os
+import random
+import re
+import time
+
+from django.conf import settings
+from django.core import signing
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+
+from auths.routers import pinned_to_primary, wrote_to_primary
+
+
+class ReplicaPinningMiddleware:
+
+    """
+    Gives clients read-your-writes consistency across requests.
+
+    A request that wrote to the primary sets a short-lived cookie, and while
+    the cookie is present that client's reads are served by the primary
+    instead of a possibly lagging replica.
+    """
+
+    def __init__(self, get_response):
+
+        self.get_response = get_response
+
+    def __call__(self, request):
+
+        pinned_token = pinned_to_primary.set(settings.REPLICA_PIN_COOKIE in request.COOKIES)
+
+        wrote_token = wrote_to_primary.set(False)
+
+        try:
+
+            response = self.get_response(request)
+
+            if wrote_to_primary.get():
+
+                response.set_cookie(
+                    settings.REPLICA_PIN_COOKIE, '1',
+                    max_age=settings.REPLICA_PIN_SECONDS,
+                    httponly=True,
+                    secure=True,
+                    samesite='Lax'
+                )
+
+            return response
+
+        finally:
+
+            pinned_to_primary.reset(pinned_token)
+
+            wrote_to_primary.reset(wrote_token)
+
+
+class CorsPreflightMiddleware:
+
+    """
+    Answers CORS preflight requests for CORS_PREFLIGHT_PATH_PREFIX before
+    the rest of the middleware stack runs.
+
+    The response headers are computed once from the django-cors-headers
+    settings. The Access-Control-Max-Age header (CORS_PREFLIGHT_MAX_AGE)
+    lets browsers cache the result instead of preflighting every login
+    and refresh. Must be the first entry of MIDDLEWARE.
+    """
+
+    def __init__(self, get_response):
+
+        from corsheaders.conf import conf
+
+        self.get_response = get_response
+
+        self.path_prefix = settings.CORS_PREFLIGHT_PATH_PREFIX
+
+        self.allow_all_origins = conf.CORS_ALLOW_ALL_ORIGINS
+
+        self.allowed_origins = frozenset(conf.CORS_ALLOWED_ORIGINS)
+
+        self.allowed_origin_regexes = [re.compile(regex) for regex in conf.CORS_ALLOWED_ORIGIN_REGEXES]
+
+        self.preflight_headers = {
+            'Access-Control-Allow-Headers': ', '.join(conf.CORS_ALLOW_HEADERS),
+            'Access-Control-Allow-Methods': ', '.join(conf.CORS_ALLOW_METHODS),
+            'Content-Length': '0',
+        }
+
+        if conf.CORS_ALLOW_CREDENTIALS:
+
+            self.preflight_headers['Access-Control-Allow-Credentials'] = 'true'
+
+        if conf.CORS_PREFLIGHT_MAX_AGE:
+
+            self.preflight_headers['Access-Control-Max-Age'] = str(conf.CORS_PREFLIGHT_MAX_AGE)
+
+    def __call__(self, request):
+
+        if (
+            request.method == 'OPTIONS'
+            and 'HTTP_ACCESS_CONTROL_REQUEST_METHOD' in request.META
+            and request.path_info.startswith(self.path_prefix)
+        ):
+
+            return self.preflight_response(request.headers.get('Origin'))
+
+        return self.get_response(request)
+
+    def origin_allowed(self, origin):
+
+        if self.allow_all_origins or origin in self.allowed_origins:
+
+            return True
+
+        return any(regex.match(origin) for regex in self.allowed_origin_regexes)
+
+    def preflight_response(self, origin):
+
+        response = HttpResponse()
+
+        # As with django-cors-headers, a disallowed origin gets no CORS headers
+        # and the browser blocks the actual request.
+        if origin and self.origin_allowed(origin):
+
+            for header, value in self.preflight_headers.items():
+
+                response[header] = value
+
+            response['Access-Control-Allow-Origin'] = origin
+
+        patch_vary_headers(response, ('origin',))
+
+        return response
+
+
+PROFILING_SALT = 'auths.profiling'
+
+
+def make_profiling_token():
+
+    """Returns a value for the profiling header, valid for PROFILING['TOKEN_MAX_AGE'] seconds."""
+
+    return signing.TimestampSigner(salt=PROFILING_SALT).sign('profile')
+
+
+class ProfilingMiddleware:
+
+    """
+    Runs cProfile around a single view call on demand.
+
+    A request is profiled when it carries a valid signed PROFILING['HEADER']
+    (see `manage.py profiling_token`) or, for staff users, the `profile`
+    query parameter, and then passes the PROFILING['SAMPLE_RATE'] draw.
+    The staff check sees only session authentication (the admin): JWT users
+    are authenticated later by DRF, so API calls need the signed header. The
+    profile is written to PROFILING['DIRECTORY'], keeping the newest
+    PROFILING['KEEP'] files, or returned as a download with `profile=download`
+    or the `X-Profile-Download` header.
+
+    Removed from the stack at startup unless PROFILING['ENABLED'] is set.
+    """
+
+    def __init__(self, get_response):
+
+        config = settings.PROFILING
+
+        if not config['ENABLED']:
+
+            raise MiddlewareNotUsed
+
+        self.get_response = get_response
+
+        self.header = 'HTTP_' + config['HEADER'].upper().replace('-', '_')
+
+        self.sample_rate = config['SAMPLE_RATE']
+
+        self.directory = config['DIRECTORY']
+
+        self.keep = config['KEEP']
+
+        self.token_max_age = config['TOKEN_MAX_AGE']
+
+        self.signer = signing.TimestampSigner(salt=PROFILING_SALT)
+
+    def __call__(self, request):
+
+        return self.get_response(request)
+
+    def is_triggered(self, request):
+
+        token = request.META.get(self.header)
+
+        if token is not None:
+
+            try:
+
+                self.signer.unsign(token, max_age=self.token_max_age)
+
+            except signing.BadSignature:
+
+                return False
+
+        elif 'profile' not in request.GET or not getattr(getattr(request, 'user', None), 'is_staff', False):
+
+            return False
+
+        return random.random() < self.sample_rate
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+
+        if self.header not in request.META and 'profile' not in request.GET:
+
+            return None
+
+        if not self.is_triggered(request):
+
+            return None
+
+        profiler = cProfile.Profile()
+
+        started = time.perf_counter()
+
+        response = profiler.runcall(view_func, request, *view_args, **view_kwargs)
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+
+        profiler.create_stats()
+
+        data = marshal.dumps(profiler.stats)
+
+        name = '{:.0f}-{}-{:.0f}ms.prof'.format(
+            time.time() * 1000,
+            request.path.strip('/').replace('/', '-') or 'root',
+            elapsed_ms
+        )
+
+        if request.GET.get('profile') == 'download' or 'HTTP_X_PROFILE_DOWNLOAD' in request.META:
+
+            download = HttpResponse(data, content_type='application/octet-stream')
+
+            download['Content-Disposition'] = f'attachment; filename="{name}"'
+
+            return download
+
+        self.write_profile(name, data)
+
+        response['X-Profile-File'] = name
+
+        return response
+
+    def write_profile(self, name, data):
+
+        os.makedirs(self.directory, exist_ok=True)
+
+        with open(os.path.join(self.directory, name), 'wb') as profile_file:
+
+            profile_file.write(data)
+
+        profiles = sorted(entry for entry in os.listdir(self.directory) if entry.endswith('.prof'))
+
+        for old_profile in profiles[:-self.keep]:
+
+            os.remove(os.path.join(self.directory, old_profile))
+
+
+class ForwardAuthMiddleware:
+
+    """
+    Serves FORWARD_AUTH_PATH before sessions, CSRF, auth middleware and DRF
+    run. Should be the first entry of MIDDLEWARE.
+    """
+
+    def __init__(self, get_response):
+
+        from auths.forward_auth import forward_auth
+
+        self.get_response = get_response
+
+        self.path = settings.FORWARD_AUTH_PATH
+
+        self.forward_auth = forward_auth
+
+    def __call__(self, request):
+
+        if request.path_info == self.path:
+
+            return self.forward_auth(request)
+
+        return self.get_response(request)
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.4 on 2026-10-18 23:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auths', '0002_authevent'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='projectuser',
+            name='token_version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.4 on 2026-10-18 23:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auths', '0003_projectuser_token_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='projectuser',
+            name='is_active',
+            field=models.BooleanField(default=True),
+        ),
+        migrations.AddField(
+            model_name='projectuser',
+            name='is_staff',
+            field=models.BooleanField(default=False, help_text='Designates whether the user can log into the admin site.'),
+        ),
+    ]
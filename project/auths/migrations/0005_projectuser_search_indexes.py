@@ -0,0 +1,51 @@
+# Generated by Django 5.1.4 on 2026-10-18 23:32
+
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import AddIndexConcurrently
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class AddPostgresIndexConcurrently(AddIndexConcurrently):
+
+    """
+    AddIndexConcurrently that only touches the database on PostgreSQL.
+
+    The index is still added to the model state everywhere, so it matches
+    ProjectUser.Meta.indexes; other databases (e.g. SQLite in development
+    and tests) simply go without it.
+    """
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+
+        if schema_editor.connection.vendor == 'postgresql':
+
+            super().database_forwards(app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+
+        if schema_editor.connection.vendor == 'postgresql':
+
+            super().database_backwards(app_label, schema_editor, from_state, to_state)
+
+
+class Migration(migrations.Migration):
+
+    # Build the indexes without locking the users table against writes.
+    atomic = False
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('auths', '0004_projectuser_is_active_is_staff'),
+    ]
+
+    operations = [
+        AddPostgresIndexConcurrently(
+            model_name='projectuser',
+            index=models.Index(django.db.models.functions.text.Upper('email'), name='auths_user_email_upper_idx'),
+        ),
+        AddPostgresIndexConcurrently(
+            model_name='projectuser',
+            index=models.Index(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('nickname'), name='text_pattern_ops'), name='auths_user_nickname_prefix_idx'),
+        ),
+    ]
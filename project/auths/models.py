@@ -1,5 +1,7 @@
 from django.contrib.auth.models import AbstractBaseUser, PermissionsMixin, BaseUserManager
+from django.contrib.postgres.indexes import OpClass
 from django.db import models
+from django.db.models.functions import Upper
 
 
 class ProjectUserManager(BaseUserManager):
@@ -8,6 +10,12 @@ class ProjectUserManager(BaseUserManager):
 
         return self.get(nickname=nickname)
 
+    def get_for_login(self, identifier):
+
+        """User whose email or, failing that, nickname is `identifier`; None if there is none."""
+
+        return self.filter(email=identifier).first() or self.filter(nickname=identifier).first()
+
     def create_user(self, username, email, password=None, **extra_fields):
 
         if not email:
@@ -20,6 +28,12 @@ class ProjectUserManager(BaseUserManager):
         user.save(using=self._db)
         return user
 
+    def create_superuser(self, username, email, password=None, **extra_fields):
+
+        extra_fields.setdefault('is_staff', True)
+        extra_fields.setdefault('is_superuser', True)
+        return self.create_user(username, email, password, **extra_fields)
+
 
 class ProjectUser(AbstractBaseUser, PermissionsMixin):
 
@@ -49,6 +63,92 @@ class ProjectUser(AbstractBaseUser, PermissionsMixin):
                             null=False,
                             )
 
+    # Durable copy of the token version cached in Redis, see auths.authentication.
+    token_version = models.PositiveIntegerField(
+                                        default=0,
+                                        )
+
+    is_active = models.BooleanField(
+                                default=True,
+                                )
+
+    is_staff = models.BooleanField(
+                            default=False,
+                            help_text='Designates whether the user can log into the admin site.',
+                            )
+
     USERNAME_FIELD = 'nickname'
 
+    REQUIRED_FIELDS = ['username', 'email']
+
+    class Meta:
+
+        # Serve the admin's case-insensitive exact email and nickname prefix search.
+        # Built on PostgreSQL only, migration 0005 skips them on other databases.
+        indexes = [
+            models.Index(Upper('email'), name='auths_user_email_upper_idx'),
+            models.Index(OpClass(Upper('nickname'), name='text_pattern_ops'), name='auths_user_nickname_prefix_idx'),
+        ]
+
     objects = ProjectUserManager()
+
+
+class AuthEvent(models.Model):
+
+    """Audit trail entry of an authentication event, written in batches by auths.audit."""
+
+    LOGIN = 'login'
+    LOGIN_FAILED = 'login_failed'
+    REGISTER = 'register'
+    REGISTER_CONFIRM = 'register_confirm'
+    LOGOUT = 'logout'
+    PASSWORD_CHANGE = 'password_change'
+
+    EVENT_CHOICES = [
+        (LOGIN, 'Login'),
+        (LOGIN_FAILED, 'Failed login'),
+        (REGISTER, 'Registration'),
+        (REGISTER_CONFIRM, 'Registration confirmed'),
+        (LOGOUT, 'Logout'),
+        (PASSWORD_CHANGE, 'Password change'),
+    ]
+
+    event = models.CharField(
+                        max_length=32,
+                        choices=EVENT_CHOICES,
+                        )
+
+    # No database constraint: batched inserts should not lock user rows and
+    # events must outlive deleted users. Lookups by user use the composite index.
+    user = models.ForeignKey(
+                        ProjectUser,
+                        null=True,
+                        blank=True,
+                        on_delete=models.DO_NOTHING,
+                        db_constraint=False,
+                        db_index=False,
+                        related_name='auth_events',
+                        )
+
+    identifier = models.CharField(
+                            max_length=254,
+                            blank=True,
+                            )
+
+    ip_address = models.GenericIPAddressField(
+                                        null=True,
+                                        blank=True,
+                                        )
+
+    user_agent = models.CharField(
+                            max_length=255,
+                            blank=True,
+                            )
+
+    created_at = models.DateTimeField()
+
+    class Meta:
+
+        indexes = [
+            models.Index(fields=['user', 'created_at'], name='auths_event_user_created_idx'),
+        ]
@@ -0,0 +1,51 @@
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+
+
+# Set when the current request must read from the primary, either because
+# the client wrote recently (pin cookie) or because it wrote in this request.
+pinned_to_primary = ContextVar('pinned_to_primary', default=False)
+
+wrote_to_primary = ContextVar('wrote_to_primary', default=False)
+
+
+class PrimaryReplicaRouter:
+
+    """
+    Routes reads of REPLICA_ROUTED_APPS to DATABASE_REPLICAS and every write
+    to the primary. After a write, reads of the same request go to the
+    primary as well, so callers always see their own writes.
+    """
+
+    def db_for_read(self, model, **hints):
+
+        replicas = settings.DATABASE_REPLICAS
+
+        if not replicas or pinned_to_primary.get():
+
+            return 'default'
+
+        if model._meta.app_label not in settings.REPLICA_ROUTED_APPS:
+
+            return 'default'
+
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+
+        pinned_to_primary.set(True)
+
+        wrote_to_primary.set(True)
+
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+
+        # Replicas hold the same data as the primary.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+
+        return db == 'default'
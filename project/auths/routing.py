@@ -0,0 +1,8 @@
+from django.urls import path
+
+from auths.consumers import SessionConsumer
+
+
+websocket_urlpatterns = [
+    path('ws/auth/session', SessionConsumer.as_asgi(), name='ws_session'),
+]
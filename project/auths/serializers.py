@@ -1,14 +1,16 @@
 import re
 
 from rest_framework import serializers, status
-from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
-from django.http import JsonResponse
-
-from django.contrib.auth import authenticate
 
+from auths.bloom import is_taken
 from auths.models import ProjectUser
 
 
+EMAIL_PATTERN = re.compile(r'^[a-zA-Z0-9.%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,4}$')
+
+PASSWORD_PATTERN = re.compile(r'^(?=.*[!@#$%^&()+}{":;\'?/>.<,`~])(?=.*\d)[^\s]{8,}$')
+
+
 class RegistrationSerializer(serializers.ModelSerializer):
 
     password = serializers.CharField(write_only=True, help_text="The user's password.")
@@ -36,7 +38,7 @@ class RegistrationSerializer(serializers.ModelSerializer):
 
         """Ensure the nickname is unique and doesn't exist in the database."""
 
-        if ProjectUser.objects.filter(nickname=value).exists():
+        if is_taken('nickname', value):
 
             raise serializers.ValidationError("User with this nickname already exists.")
 
@@ -46,13 +48,11 @@ class RegistrationSerializer(serializers.ModelSerializer):
 
         """Ensure the email is valid and unique in the database."""
 
-        email_pattern = r'^[a-zA-Z0-9.%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,4}$'
-
-        if not re.match(email_pattern, value):
+        if not EMAIL_PATTERN.match(value):
 
             raise serializers.ValidationError("Invalid email format.")
 
-        if ProjectUser.objects.filter(email=value).exists():
+        if is_taken('email', value):
 
             raise serializers.ValidationError("User with this email already exists.")
 
@@ -67,9 +67,7 @@ class RegistrationSerializer(serializers.ModelSerializer):
         - Contains at least one special character
         """
 
-        pattern = r'^(?=.*[!@#$%^&()+}{":;\'?/>.<,`~])(?=.*\d)[^\s]{8,}$'
-
-        if not re.match(pattern, value):
+        if not PASSWORD_PATTERN.match(value):
             raise serializers.ValidationError(
                 "Password must be at least 8 characters long, contain at least one digit, "
                 "contain at least one special character, and not have any spaces."
@@ -119,6 +117,41 @@ class RegistrationConfirmSerializer(serializers.Serializer):
         return value
 
 
+class RegistrationResendSerializer(serializers.Serializer):
+
+    """Serializer for resending the registration code of a pending registration."""
+
+    email = serializers.EmailField()
+
+
+class AvailabilitySerializer(serializers.Serializer):
+
+    """
+    Serializer for nickname and email availability checks.
+    At least one of the two must be given.
+    """
+
+    nickname = serializers.CharField(required=False, max_length=30)
+
+    email = serializers.CharField(required=False, max_length=254)
+
+    def validate_email(self, value):
+
+        if not EMAIL_PATTERN.match(value):
+
+            raise serializers.ValidationError("Invalid email format.")
+
+        return value
+
+    def validate(self, attrs):
+
+        if not attrs:
+
+            raise serializers.ValidationError("Provide a nickname or an email.")
+
+        return attrs
+
+
 class AuthorizationSerializer(serializers.Serializer):
 
     """
@@ -149,27 +182,24 @@ class AuthorizationSerializer(serializers.Serializer):
                                             }
                                         })
 
-        user = authenticate(username=nickname, password=password)
+        user = ProjectUser.objects.get_for_login(nickname)
 
         if user is None:
 
-            try:
+            # Hash anyway, so a missing user takes as long as a wrong password.
+            ProjectUser().set_password(password)
 
-                user = ProjectUser.objects.get(email=nickname)
+            raise serializers.ValidationError({"nickname": "User does not exist."})
 
-            except ProjectUser.DoesNotExist:
+        # The only password verification of a login. Hashes made by another
+        # hasher or with outdated parameters are replaced right here.
+        if not user.check_password(password):
 
-                try:
+            raise serializers.ValidationError({'password': 'Wrong password.'})
 
-                    user = ProjectUser.objects.get(nickname=nickname)
+        if not user.is_active:
 
-                except ProjectUser.DoesNotExist:
-
-                    raise serializers.ValidationError({"nickname": "User does not exist."})
-
-            if not user.check_password(password):
-
-                raise serializers.ValidationError({'password': 'Wrong password.'})
+            raise serializers.ValidationError({'nickname': 'User account is disabled.'})
 
         attrs['user'] = user
 
@@ -222,9 +252,7 @@ class PasswordRecoverySerializer(serializers.Serializer):
 
         """Ensure the new password meets the strength requirements."""
 
-        pattern = r'^(?=.*[!@#$%^&()+}{":;\'?/>.<,`~])(?=.*\d)[^\s]{8,}$'
-
-        if not re.match(pattern, value):
+        if not PASSWORD_PATTERN.match(value):
             raise serializers.ValidationError(
                 "Password must be at least 8 characters long, contain at least one digit, "
                 "contain at least one special character, and not have any spaces."
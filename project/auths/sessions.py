@@ -0,0 +1,178 @@
+import json
+import time
+
+from rest_framework_simplejwt.settings import api_settings
+
+from django.conf import settings
+
+from auths.cache import get_redis
+
+
+# Adds a session, drops expired ones and evicts the oldest above the limit.
+# KEYS: index, meta, revoked; ARGV: now, expires_at, session_id, info, max_sessions, lifetime
+ADD_SESSION_SCRIPT = """
+local index, meta, revoked = KEYS[1], KEYS[2], KEYS[3]
+local now, max_sessions = tonumber(ARGV[1]), tonumber(ARGV[5])
+
+local expired = redis.call('ZRANGEBYSCORE', index, '-inf', now)
+if #expired > 0 then
+    redis.call('ZREMRANGEBYSCORE', index, '-inf', now)
+    redis.call('HDEL', meta, unpack(expired))
+end
+redis.call('ZREMRANGEBYSCORE', revoked, '-inf', now)
+
+redis.call('ZADD', index, ARGV[2], ARGV[3])
+redis.call('HSET', meta, ARGV[3], ARGV[4])
+
+local evicted = {}
+local excess = redis.call('ZCARD', index) - max_sessions
+if excess > 0 then
+    local oldest = redis.call('ZRANGE', index, 0, excess - 1, 'WITHSCORES')
+    for i = 1, #oldest, 2 do
+        redis.call('ZADD', revoked, oldest[i + 1], oldest[i])
+        table.insert(evicted, oldest[i])
+    end
+    redis.call('ZREMRANGEBYRANK', index, 0, excess - 1)
+    redis.call('HDEL', meta, unpack(evicted))
+end
+
+for _, key in ipairs(KEYS) do
+    redis.call('EXPIRE', key, ARGV[6])
+end
+return evicted
+"""
+
+
+def get_keys(user_id):
+
+    # The hash tag keeps the three keys of a user on one Redis node.
+    base = f'auth:sessions:{{{user_id}}}'
+
+    return [base, f'{base}:meta', f'{base}:revoked']
+
+
+def get_lifetime():
+
+    # No session outlives a refresh token, so neither do the keys holding it.
+    return int(api_settings.REFRESH_TOKEN_LIFETIME.total_seconds())
+
+
+def add(user_id, session_id, expires_at, version=0, request=None):
+
+    """
+    Records a new session of a user and returns the ids of sessions it evicted.
+
+    At most AUTH_MAX_SESSIONS sessions are kept per user; the ones expiring
+    first are evicted and their refresh tokens revoked.
+    """
+
+    info = {
+        'version': version,
+        'created_at': int(time.time()),
+        'ip_address': None,
+        'user_agent': '',
+    }
+
+    if request is not None:
+
+        info['ip_address'] = request.META.get('REMOTE_ADDR') or None
+
+        info['user_agent'] = request.META.get('HTTP_USER_AGENT', '')[:255]
+
+    redis = get_redis(get_keys(user_id)[0])
+
+    evicted = redis.eval(
+        ADD_SESSION_SCRIPT,
+        3,
+        *get_keys(user_id),
+        int(time.time()),
+        int(expires_at),
+        session_id,
+        json.dumps(info, separators=(',', ':')),
+        settings.AUTH_MAX_SESSIONS,
+        get_lifetime(),
+    )
+
+    return [session_id.decode() for session_id in evicted]
+
+
+def list_sessions(user_id, version=None):
+
+    """
+    Live sessions of a user, newest first.
+
+    Sessions issued for another token version than `version` were revoked
+    by a logout everywhere and are left out.
+    """
+
+    index, meta, _ = get_keys(user_id)
+
+    pipe = get_redis(index).pipeline(transaction=False)
+
+    pipe.zrangebyscore(index, time.time(), '+inf', withscores=True)
+
+    pipe.hgetall(meta)
+
+    entries, infos = pipe.execute()
+
+    sessions = []
+
+    for session_id, expires_at in reversed(entries):
+
+        info = json.loads(infos.get(session_id, '{}'))
+
+        if version is not None and info.get('version', 0) != version:
+
+            continue
+
+        sessions.append({
+            'id': session_id.decode(),
+            'expires_at': int(expires_at),
+            'created_at': info.get('created_at'),
+            'ip_address': info.get('ip_address'),
+            'user_agent': info.get('user_agent', ''),
+        })
+
+    return sessions
+
+
+def revoke(user_id, session_id):
+
+    """Revokes one session of a user. Returns False if it is unknown or already gone."""
+
+    index, meta, revoked = get_keys(user_id)
+
+    redis = get_redis(index)
+
+    expires_at = redis.zscore(index, session_id)
+
+    if expires_at is None:
+
+        return False
+
+    pipe = redis.pipeline()
+
+    pipe.zadd(revoked, {session_id: expires_at})
+
+    pipe.zrem(index, session_id)
+
+    pipe.hdel(meta, session_id)
+
+    pipe.expire(revoked, get_lifetime())
+
+    pipe.execute()
+
+    return True
+
+
+def is_revoked(user_id, session_id):
+
+    """Whether a session was revoked or evicted. A session without an id never is."""
+
+    if not session_id:
+
+        return False
+
+    _, _, revoked = get_keys(user_id)
+
+    return get_redis(revoked).zscore(revoked, session_id) is not None
@@ -0,0 +1,21 @@
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from auths import bloom
+from auths.models import ProjectUser
+from auths.utils import ProfileService
+
+
+@receiver(post_save, sender=ProjectUser)
+def invalidate_profile(sender, instance, **kwargs):
+
+    ProfileService.invalidate(instance.pk)
+
+
+@receiver(post_save, sender=ProjectUser)
+def add_to_identity_filter(sender, instance, created, update_fields=None, **kwargs):
+
+    # Renamed users keep their old values in the filter too, which only costs a query.
+    if created or update_fields is None or set(update_fields) & set(bloom.IDENTITY_FIELDS):
+
+        bloom.add_user(instance)
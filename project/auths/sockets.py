@@ -0,0 +1,71 @@
+import logging
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+
+
+logger = logging.getLogger(__name__)
+
+
+def get_user_group(user_id):
+
+    return f'auth.user.{user_id}'
+
+
+def get_session_group(session_id):
+
+    return f'auth.session.{session_id}'
+
+
+def broadcast_revoke(*groups):
+
+    """
+    Sends auth.revoke to `groups`, all from one event loop hop.
+
+    A no-op without CHANNEL_LAYERS, e.g. under project.settings_auth, where
+    channels is then never imported.
+    """
+
+    if not groups or not getattr(settings, 'CHANNEL_LAYERS', None):
+
+        return
+
+    from channels.layers import get_channel_layer
+
+    channel_layer = get_channel_layer()
+
+    if channel_layer is None:
+
+        return
+
+    async def send():
+
+        for group in groups:
+
+            await channel_layer.group_send(group, {'type': 'auth.revoke'})
+
+    try:
+
+        async_to_sync(send)()
+
+    except Exception:
+
+        logger.exception('Failed to broadcast socket revocation to %d groups', len(groups))
+
+
+def revoke_user_sockets(*user_ids):
+
+    """
+    Closes every open WebSocket of the given users, across all workers,
+    through the channel layer. For revocations of all sessions, e.g. token
+    version bumps.
+    """
+
+    broadcast_revoke(*[get_user_group(user_id) for user_id in user_ids if user_id is not None])
+
+
+def revoke_session_sockets(*session_ids):
+
+    """Closes the open WebSockets of the given refresh sessions only."""
+
+    broadcast_revoke(*[get_session_group(session_id) for session_id in session_ids if session_id])
@@ -0,0 +1,609 @@
+import contextlib
+import copy
+import time
+import uuid
+from datetime import datetime, timezone
+from io import StringIO
+from unittest import mock, skipUnless
+
+import fakeredis
+from asgiref.sync import sync_to_async
+from channels.testing import WebsocketCommunicator
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connections
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+
+from auths import bloom
+from auths.cache import HashRing, hash_tag, get_redis
+from auths.consumers import CLOSE_UNAUTHORIZED, SessionConsumer
+from auths.middleware import ReplicaPinningMiddleware
+from auths.models import ProjectUser
+from auths.tokens import TokenMinter
+from auths.sockets import revoke_session_sockets, revoke_user_sockets
+
+
+def sharded_caches(nodes, pools=None, namespaces=None):
+
+    """CACHES of a ShardedRedisClient on in-memory fakeredis servers, one per node URL."""
+
+    return {
+        'default': {
+            'BACKEND': 'django_redis.cache.RedisCache',
+            'LOCATION': list(nodes),
+            'OPTIONS': {
+                'CLIENT_CLASS': 'auths.cache.ShardedRedisClient',
+                'POOLS': pools or {},
+                'NAMESPACES': namespaces or {},
+                'CONNECTION_POOL_KWARGS': {'connection_class': fakeredis.FakeConnection},
+            },
+        }
+    }
+
+
+def project_caches(nodes=('redis://cache-a:6379', 'redis://cache-b:6379')):
+
+    """The project's CACHES, namespaces included, moved onto fakeredis nodes."""
+
+    options = settings.CACHES['default']['OPTIONS']
+
+    return sharded_caches(
+        nodes,
+        pools={pool: [] for pool in options.get('POOLS', {})},
+        namespaces=options.get('NAMESPACES', {}),
+    )
+
+
+def flush_nodes():
+
+    """Empties every node of the default cache; fakeredis keeps servers for the whole process."""
+
+    for node in cache.client._server:
+
+        cache.client.get_node_client(node).flushall()
+
+
+class MiddlewareInvocationRecorder:
+
+    """Placed after every MIDDLEWARE entry, counts the entries a request got past."""
+
+    passed = 0
+
+    def __init__(self, get_response):
+
+        self.get_response = get_response
+
+    def __call__(self, request):
+
+        MiddlewareInvocationRecorder.passed += 1
+
+        return self.get_response(request)
+
+
+RECORDER = f'{__name__}.MiddlewareInvocationRecorder'
+
+MIDDLEWARE = list(settings.MIDDLEWARE)
+
+PREFLIGHT_MIDDLEWARE = 'auths.middleware.CorsPreflightMiddleware'
+
+
+# The auth-only settings profile runs without CORS.
+@skipUnless(PREFLIGHT_MIDDLEWARE in MIDDLEWARE, 'CorsPreflightMiddleware is not installed')
+@override_settings(MIDDLEWARE=[entry for middleware in MIDDLEWARE for entry in (middleware, RECORDER)])
+class CorsPreflightMiddlewareTests(SimpleTestCase):
+
+    def setUp(self):
+
+        MiddlewareInvocationRecorder.passed = 0
+
+        self.origin = settings.CORS_ALLOWED_ORIGINS[0]
+
+    def test_auth_preflight_stops_at_cors_preflight_middleware(self):
+
+        response = self.client.options(
+            '/auth/login',
+            HTTP_ORIGIN=self.origin,
+            HTTP_ACCESS_CONTROL_REQUEST_METHOD='POST',
+        )
+
+        self.assertEqual(response.status_code, 200)
+
+        self.assertEqual(response['Access-Control-Allow-Origin'], self.origin)
+
+        self.assertIn('Access-Control-Max-Age', response)
+
+        # Only the middleware up to and including CorsPreflightMiddleware ran,
+        # the ones before it passed the request on.
+        self.assertEqual(
+            MiddlewareInvocationRecorder.passed,
+            MIDDLEWARE.index(PREFLIGHT_MIDDLEWARE),
+        )
+
+    def test_other_requests_pass_the_whole_stack(self):
+
+        self.client.get('/auth/missing', HTTP_ORIGIN=self.origin)
+
+        self.assertEqual(MiddlewareInvocationRecorder.passed, len(MIDDLEWARE))
+
+
+class HashRingTests(SimpleTestCase):
+
+    def test_adding_a_node_moves_keys_only_to_it(self):
+
+        nodes = ['a', 'b', 'c', 'd']
+
+        keys = [f'auth:token_version:{user_id}' for user_id in range(10000)]
+
+        before = HashRing(nodes)
+
+        after = HashRing(nodes + ['e'])
+
+        moved = [key for key in keys if before.get_node(key) != after.get_node(key)]
+
+        self.assertEqual({after.get_node(key) for key in moved}, {'e'})
+
+        # About 1/(n + 1) of the keys move.
+        self.assertAlmostEqual(len(moved) / len(keys), 1 / 5, delta=0.05)
+
+    def test_removing_a_node_moves_only_its_keys(self):
+
+        keys = [str(key) for key in range(2000)]
+
+        before = HashRing(['a', 'b', 'c'])
+
+        after = HashRing(['a', 'b', 'c'])
+
+        after.remove_node('c')
+
+        for key in keys:
+
+            if before.get_node(key) != 'c':
+
+                self.assertEqual(after.get_node(key), before.get_node(key))
+
+    def test_hash_tag(self):
+
+        self.assertEqual(hash_tag('auth:sessions:{42}:revoked'), '42')
+
+        self.assertEqual(hash_tag('auth:sessions:{42}'), '42')
+
+        # Without a non-empty tag the whole key decides.
+        self.assertEqual(hash_tag('auth:sessions:{}:meta'), 'auth:sessions:{}:meta')
+
+        self.assertEqual(hash_tag('auth:token_version:42'), 'auth:token_version:42')
+
+
+NODES = ['redis://node-a:6379', 'redis://node-b:6379', 'redis://node-c:6379']
+
+
+@override_settings(CACHES=sharded_caches(
+    NODES,
+    pools={'revocations': ['redis://revoke-a:6379'], 'codes': []},
+    namespaces={
+        'auth:': 'revocations',
+        'auth:profile:': 'default',
+        'auth:register:': 'codes',
+    },
+))
+class ShardedRedisClientTests(SimpleTestCase):
+
+    def setUp(self):
+
+        flush_nodes()
+
+        self.client = cache.client
+
+    def test_keys_sharing_a_hash_tag_share_a_node(self):
+
+        for user_id in range(50):
+
+            base = f'shared:{{{user_id}}}'
+
+            self.assertEqual(
+                {self.client.route(key) for key in [base, f'{base}:meta', f'{base}:revoked']},
+                {self.client.route(base)},
+            )
+
+    def test_longest_namespace_prefix_wins(self):
+
+        self.assertEqual(self.client.route('auth:sessions:{1}'), 'redis://revoke-a:6379')
+
+        self.assertIn(self.client.route('auth:profile:1'), NODES)
+
+        # A pool without nodes of its own stays on the default one.
+        self.assertIn(self.client.route('auth:register:a@b.c'), NODES)
+
+        self.assertIn(self.client.route('other:1'), NODES)
+
+    def test_many_operations_span_nodes(self):
+
+        data = {f'item:{index}': index for index in range(100)}
+
+        cache.set_many(data, timeout=60)
+
+        used = [node for node in NODES if self.client.get_node_client(node).dbsize()]
+
+        self.assertEqual(len(used), len(NODES))
+
+        # Each key is stored on the node its route names.
+        for key in data:
+
+            self.assertTrue(self.client.get_node_client(self.client.route(key)).exists(self.client.make_key(key)))
+
+        self.assertEqual(cache.get_many(list(data) + ['missing']), data)
+
+        self.assertEqual(cache.delete_many(list(data)), len(data))
+
+        self.assertEqual(cache.get_many(list(data)), {})
+
+    def test_rebalance_keeps_keys_readable_after_adding_a_node(self):
+
+        from auths import sessions
+
+        for user_id in range(100):
+
+            sessions.add(user_id, f'session-{user_id}', 2 ** 31)
+
+            sessions.revoke(user_id, f'session-{user_id}')
+
+            cache.set(f'auth:token_version:{user_id}', user_id, timeout=60)
+
+        call_command('rebalance_cache', '--pool', 'revocations', '--add', 'redis://revoke-b:6379', stdout=StringIO())
+
+        resized = copy.deepcopy(settings.CACHES)
+
+        resized['default']['OPTIONS']['POOLS']['revocations'].append('redis://revoke-b:6379')
+
+        with override_settings(CACHES=resized):
+
+            routes = {cache.client.route(f'auth:sessions:{{{user_id}}}') for user_id in range(100)}
+
+            self.assertIn('redis://revoke-b:6379', routes)
+
+            for user_id in range(100):
+
+                self.assertTrue(sessions.is_revoked(user_id, f'session-{user_id}'))
+
+                self.assertEqual(cache.get(f'auth:token_version:{user_id}'), user_id)
+
+            cache.client.get_node_client('redis://revoke-b:6379').flushall()
+
+
+# The router tests need a replica alias. Without POSTGRES_REPLICA_HOSTS the
+# test run gets one mirroring the default database, as configured replicas do.
+REPLICA = settings.DATABASE_REPLICAS[0] if settings.DATABASE_REPLICAS else 'replica'
+
+if REPLICA not in connections.settings:
+
+    connections.settings[REPLICA] = {
+        **connections.settings['default'],
+        'TEST': {**connections.settings['default']['TEST'], 'MIRROR': 'default'},
+    }
+
+
+# Not a TestCase: its transaction on the mirror would lock SQLite's shared
+# in-memory test database against the writes made through default.
+@override_settings(DATABASE_REPLICAS=[REPLICA], CACHES=project_caches())
+class PrimaryReplicaRouterTests(TransactionTestCase):
+
+    databases = {'default', REPLICA}
+
+    def setUp(self):
+
+        flush_nodes()
+
+        self.factory = RequestFactory()
+
+        self.middleware = ReplicaPinningMiddleware(self.view)
+
+    def view(self, request):
+
+        self.reads = [ProjectUser.objects.all().db]
+
+        if request.method == 'POST':
+
+            ProjectUser.objects.create_user(username='Pin', nickname='pinned', email='pin@example.com', password='x')
+
+            self.reads.append(ProjectUser.objects.all().db)
+
+        return HttpResponse()
+
+    def test_reads_go_to_the_replica(self):
+
+        response = self.middleware(self.factory.get('/auth/me'))
+
+        self.assertEqual(self.reads, [REPLICA])
+
+        self.assertNotIn(settings.REPLICA_PIN_COOKIE, response.cookies)
+
+    def test_write_pins_the_request_and_the_cookie_window_to_the_primary(self):
+
+        response = self.middleware(self.factory.post('/auth/register'))
+
+        # Read before the write, then after it within the same request.
+        self.assertEqual(self.reads, [REPLICA, 'default'])
+
+        cookie = response.cookies[settings.REPLICA_PIN_COOKIE]
+
+        self.assertEqual(cookie['max-age'], settings.REPLICA_PIN_SECONDS)
+
+        # While the client sends the cookie back, its reads stay on the primary.
+        pinned = self.factory.get('/auth/me')
+
+        pinned.COOKIES[settings.REPLICA_PIN_COOKIE] = cookie.value
+
+        self.middleware(pinned)
+
+        self.assertEqual(self.reads, ['default'])
+
+        # The pin is per request, other clients keep reading the replica.
+        self.middleware(self.factory.get('/auth/me'))
+
+        self.assertEqual(self.reads, [REPLICA])
+
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class SocketRevocationTests(SimpleTestCase):
+
+    async def connect(self, user_id, session_id):
+
+        # The scope CookieTokenAuthMiddleware would have built from the cookies.
+        communicator = WebsocketCommunicator(SessionConsumer.as_asgi(), '/ws/auth/session')
+
+        communicator.scope.update(user_id=user_id, session_id=session_id)
+
+        connected, _ = await communicator.connect()
+
+        self.assertTrue(connected)
+
+        self.assertEqual(await communicator.receive_json_from(), {'type': 'session', 'user_id': user_id})
+
+        return communicator
+
+    async def assert_closed(self, communicator):
+
+        self.assertEqual(
+            await communicator.receive_output(timeout=1),
+            {'type': 'websocket.close', 'code': CLOSE_UNAUTHORIZED},
+        )
+
+    async def test_revoke_user_sockets_closes_only_that_users_sockets(self):
+
+        first_device = await self.connect(1, 'session-a')
+
+        second_device = await self.connect(1, 'session-b')
+
+        other_user = await self.connect(2, 'session-c')
+
+        await sync_to_async(revoke_user_sockets)(1)
+
+        await self.assert_closed(first_device)
+
+        await self.assert_closed(second_device)
+
+        self.assertTrue(await other_user.receive_nothing(timeout=0.2))
+
+        await other_user.disconnect()
+
+    async def test_revoke_session_sockets_closes_only_that_session(self):
+
+        logged_out = await self.connect(1, 'session-a')
+
+        other_device = await self.connect(1, 'session-b')
+
+        await sync_to_async(revoke_session_sockets)('session-a')
+
+        await self.assert_closed(logged_out)
+
+        self.assertTrue(await other_device.receive_nothing(timeout=0.2))
+
+        await other_device.disconnect()
+
+
+class TokenMinterTests(SimpleTestCase):
+
+    def setUp(self):
+
+        self.now = int(time.time())
+
+        self.user = ProjectUser(pk=7, nickname='minter', password='pbkdf2_sha256$1$salt$hash', token_version=3)
+
+        self.version_claim = settings.AUTH_TOKEN_VERSION_CLAIM
+
+    def frozen(self):
+
+        """Fixes the clock and the jti sequence for simplejwt and TokenMinter alike."""
+
+        jtis = iter([uuid.UUID(int=index) for index in range(1, 100)])
+
+        def next_jti():
+
+            return next(jtis)
+
+        now = datetime.fromtimestamp(self.now, tz=timezone.utc)
+
+        if not settings.USE_TZ:
+
+            now = now.replace(tzinfo=None)
+
+        patches = [
+            mock.patch('rest_framework_simplejwt.tokens.aware_utcnow', return_value=now),
+            mock.patch('rest_framework_simplejwt.tokens.uuid4', side_effect=next_jti),
+            mock.patch('auths.tokens.time.time', return_value=self.now),
+            mock.patch('auths.tokens.uuid.uuid4', side_effect=next_jti),
+        ]
+
+        stack = contextlib.ExitStack()
+
+        for patch in patches:
+
+            stack.enter_context(patch)
+
+        return stack
+
+    def simplejwt_pair(self):
+
+        # As AuthenticationService issued tokens before TokenMinter.
+        with self.frozen():
+
+            refresh = RefreshToken.for_user(self.user)
+
+            refresh[self.version_claim] = self.user.token_version
+
+            return str(refresh), str(refresh.access_token)
+
+    def test_mint_pair_matches_simplejwt_byte_for_byte(self):
+
+        refresh, access = self.simplejwt_pair()
+
+        with self.frozen():
+
+            minted_refresh, minted_access, claims = TokenMinter().mint_pair(
+                self.user, **{self.version_claim: self.user.token_version}
+            )
+
+        self.assertEqual(minted_refresh, refresh)
+
+        self.assertEqual(minted_access, access)
+
+        self.assertEqual(claims, RefreshToken(minted_refresh).payload)
+
+    def test_mint_access_matches_simplejwt_byte_for_byte(self):
+
+        refresh, _ = self.simplejwt_pair()
+
+        with self.frozen():
+
+            # Decoding draws no jti, both sides take the first one for the access token.
+            expected = str(RefreshToken(refresh).access_token)
+
+        with self.frozen():
+
+            minted, expires_at = TokenMinter().mint_access(RefreshToken(refresh).payload)
+
+        self.assertEqual(minted, expected)
+
+        self.assertEqual(expires_at, self.now + int(api_settings.ACCESS_TOKEN_LIFETIME.total_seconds()))
+
+    def test_minted_tokens_validate_with_simplejwt(self):
+
+        _, access, claims = TokenMinter().mint_pair(self.user, **{self.version_claim: 3})
+
+        token = AccessToken(access)
+
+        self.assertEqual(token[api_settings.USER_ID_CLAIM], self.user.pk)
+
+        self.assertEqual(token[self.version_claim], 3)
+
+        self.assertNotEqual(token[api_settings.JTI_CLAIM], claims[api_settings.JTI_CLAIM])
+
+
+# A cheap hasher, users are created for every test.
+@override_settings(CACHES=project_caches(), PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class IdentityFilterTests(TestCase):
+
+    def setUp(self):
+
+        flush_nodes()
+
+        self.users = [
+            ProjectUser.objects.create_user(
+                username=f'User{index}', nickname=f'user{index}', email=f'user{index}@example.com', password='x'
+            )
+            for index in range(20)
+        ]
+
+    def assert_all_taken(self):
+
+        for user in self.users:
+
+            self.assertTrue(bloom.identities.might_contain(bloom.identity('nickname', user.nickname)))
+
+            self.assertTrue(bloom.identities.might_contain(bloom.identity('email', user.email)))
+
+            self.assertTrue(bloom.is_taken('nickname', user.nickname))
+
+    def test_no_false_negatives_after_add_user(self):
+
+        # Users were added by the post_save receiver.
+        self.assert_all_taken()
+
+    def test_no_false_negatives_after_rebuild(self):
+
+        get_redis(bloom.identities.key).delete(bloom.identities.key)
+
+        self.assertEqual(bloom.rebuild(batch_size=7), len(self.users))
+
+        self.assert_all_taken()
+
+    def test_missing_filter_falls_back_to_the_database(self):
+
+        get_redis(bloom.identities.key).delete(bloom.identities.key)
+
+        with self.assertNumQueries(1):
+
+            self.assertTrue(bloom.is_taken('nickname', 'user3'))
+
+        with self.assertNumQueries(1):
+
+            self.assertFalse(bloom.is_taken('nickname', 'nobody'))
+
+    def test_redis_errors_fall_back_to_the_database(self):
+
+        with mock.patch.object(bloom.identities, 'might_contain', side_effect=ConnectionError), \
+                self.assertLogs('auths.bloom', 'ERROR'):
+
+            with self.assertNumQueries(1):
+
+                self.assertTrue(bloom.is_taken('email', 'user4@example.com'))
+
+            with self.assertNumQueries(1):
+
+                self.assertFalse(bloom.is_taken('email', 'nobody@example.com'))
+
+    def test_availability_answers_from_the_filter(self):
+
+        response = self.client.get('/auth/availability', {'nickname': 'user5', 'email': 'free@example.com'})
+
+        self.assertEqual(response.status_code, 200)
+
+        self.assertEqual(response.json(), {'available': {'nickname': False, 'email': True}})
+
+    def test_availability_needs_a_nickname_or_an_email(self):
+
+        response = self.client.get('/auth/availability')
+
+        self.assertEqual(response.status_code, 400)
+
+        self.assertIn('errors', response.json())
+
+
+@override_settings(CACHES=project_caches(), PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class ForwardAuthTests(TestCase):
+
+    def setUp(self):
+
+        flush_nodes()
+
+    def test_nickname_header_is_percent_encoded(self):
+
+        from auths.tokens import get_minter
+
+        user = ProjectUser.objects.create_user(
+            username='Header', nickname='evil\r\nSet-Cookie: a=b ü', email='header@example.com', password='x'
+        )
+
+        _, access_token, _ = get_minter().mint_pair(user, **{settings.AUTH_TOKEN_VERSION_CLAIM: user.token_version})
+
+        response = self.client.get('/auth/verify', HTTP_AUTHORIZATION=f'Bearer {access_token}')
+
+        self.assertEqual(response.status_code, 204)
+
+        self.assertEqual(response['X-User-Id'], str(user.pk))
+
+        self.assertEqual(response['X-User-Nickname'], 'evil%0D%0ASet-Cookie%3A%20a%3Db%20%C3%BC')
@@ -0,0 +1,166 @@
+import base64
+import functools
+import hashlib
+import hmac
+import json
+import time
+import uuid
+
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+
+HMAC_DIGESTS = {
+    'HS256': hashlib.sha256,
+    'HS384': hashlib.sha384,
+    'HS512': hashlib.sha512,
+}
+
+
+def b64encode(data):
+
+    return base64.urlsafe_b64encode(data).rstrip(b'=')
+
+
+class TokenMinter:
+
+    """
+    Issues refresh and access tokens without simplejwt's token classes.
+
+    Claims are built as plain dicts in the order RefreshToken.for_user and
+    RefreshToken.access_token produce them and serialized the way PyJWT
+    does, so the tokens are byte for byte what simplejwt would have issued
+    and validate with it unchanged. For HMAC algorithms the encoded header
+    and the keyed HMAC state are computed once; other algorithms are signed
+    by simplejwt's token backend.
+    """
+
+    def __init__(self):
+
+        self.refresh_lifetime = int(api_settings.REFRESH_TOKEN_LIFETIME.total_seconds())
+
+        self.access_lifetime = int(api_settings.ACCESS_TOKEN_LIFETIME.total_seconds())
+
+        self.json_encoder = api_settings.JSON_ENCODER
+
+        # Added to every token by the token backend.
+        self.backend_claims = {}
+
+        if api_settings.AUDIENCE is not None:
+
+            self.backend_claims['aud'] = api_settings.AUDIENCE
+
+        if api_settings.ISSUER is not None:
+
+            self.backend_claims['iss'] = api_settings.ISSUER
+
+        # Refresh claims that are not copied into its access tokens, as in simplejwt.
+        self.no_copy_claims = (api_settings.TOKEN_TYPE_CLAIM, 'exp', api_settings.JTI_CLAIM, 'jti')
+
+        digest = HMAC_DIGESTS.get(api_settings.ALGORITHM)
+
+        self.hmac = None
+
+        if digest is not None:
+
+            key = api_settings.SIGNING_KEY
+
+            self.hmac = hmac.new(key.encode() if isinstance(key, str) else key, digestmod=digest)
+
+            header = json.dumps({'alg': api_settings.ALGORITHM, 'typ': 'JWT'}, separators=(',', ':'), sort_keys=True)
+
+            self.header = b64encode(header.encode()) + b'.'
+
+    def encode(self, claims):
+
+        if self.hmac is None:
+
+            from rest_framework_simplejwt.state import token_backend
+
+            return token_backend.encode(claims)
+
+        if self.backend_claims:
+
+            claims = {**claims, **self.backend_claims}
+
+        payload = json.dumps(claims, separators=(',', ':'), cls=self.json_encoder).encode()
+
+        signing_input = self.header + b64encode(payload)
+
+        signature = self.hmac.copy()
+
+        signature.update(signing_input)
+
+        return (signing_input + b'.' + b64encode(signature.digest())).decode()
+
+    def refresh_claims(self, user, now):
+
+        user_id = getattr(user, api_settings.USER_ID_FIELD)
+
+        claims = {
+            api_settings.TOKEN_TYPE_CLAIM: 'refresh',
+            'exp': now + self.refresh_lifetime,
+            'iat': now,
+            api_settings.JTI_CLAIM: uuid.uuid4().hex,
+            api_settings.USER_ID_CLAIM: user_id if isinstance(user_id, int) else str(user_id),
+        }
+
+        if api_settings.CHECK_REVOKE_TOKEN:
+
+            claims[api_settings.REVOKE_TOKEN_CLAIM] = get_md5_hash_password(user.password)
+
+        return claims
+
+    def access_claims(self, claims, now):
+
+        access = {
+            api_settings.TOKEN_TYPE_CLAIM: 'access',
+            'exp': now + self.access_lifetime,
+            'iat': now,
+            api_settings.JTI_CLAIM: uuid.uuid4().hex,
+        }
+
+        access.update((claim, value) for claim, value in claims.items() if claim not in self.no_copy_claims)
+
+        return access
+
+    def mint_pair(self, user, **extra_claims):
+
+        """Returns (refresh token, access token, refresh claims) for a user, like RefreshToken.for_user."""
+
+        now = int(time.time())
+
+        claims = self.refresh_claims(user, now)
+
+        claims.update(extra_claims)
+
+        return self.encode(claims), self.encode(self.access_claims(claims, now)), claims
+
+    def mint_access(self, claims):
+
+        """
+        Returns (access token, expiry) for the claims of a refresh token, like
+        RefreshToken.access_token. Also takes bare claims such as user id and
+        token version.
+        """
+
+        access = self.access_claims(claims, int(time.time()))
+
+        return self.encode(access), access['exp']
+
+
+@functools.cache
+def get_minter():
+
+    return TokenMinter()
+
+
+@receiver(setting_changed)
+def reset_minter(setting, **kwargs):
+
+    if setting in ('SIMPLE_JWT', 'SECRET_KEY'):
+
+        get_minter.cache_clear()
@@ -1,8 +1,3 @@
-from rest_framework_simplejwt.views import (
-    TokenObtainPairView,
-    TokenRefreshView,
-)
-
 from django.urls import path
 
 from auths.views import (
@@ -10,18 +5,28 @@ from auths.views import (
     Login_User,
     Logout_User,
     Register_Confirm,
+    Register_Resend,
+    Check_Availability,
     Request_Password_Recovery,
     Password_Recovery,
-    refresh_token_view
+    refresh_token_view,
+    Current_User,
+    User_Sessions,
+    Revoke_User_Session,
 )
 
 
 urlpatterns = [
     path('register', Register_User.as_view(), name="user_registration"),
+    path('availability', Check_Availability.as_view(), name="user_availability"),
     path('login', Login_User.as_view(), name="user_authorization"),
     path('logout', Logout_User.as_view(), name='user_logout'),
     path('register-confirm', Register_Confirm.as_view(), name="user_registration_confirm"),
+    path('register-resend', Register_Resend.as_view(), name="user_registration_resend"),
     path('request-password-recovery', Request_Password_Recovery.as_view(), name="request_password_recovery"),
     path('password-recovery', Password_Recovery.as_view(), name="password_recovery"),
     path('token/refresh', refresh_token_view, name='token_refresh'),
+    path('me', Current_User.as_view(), name='current_user'),
+    path('sessions', User_Sessions.as_view(), name='user_sessions'),
+    path('sessions/<str:session_id>', Revoke_User_Session.as_view(), name='revoke_user_session'),
 ]
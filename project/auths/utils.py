@@ -1,15 +1,164 @@
+import hashlib
+import json
 import random
+import secrets
+import time
+import uuid
 
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
 from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework.response import Response
 from rest_framework import status
 
-from django.contrib.auth import authenticate
+from django.conf import settings
 from django.core.exceptions import ObjectDoesNotExist
 from django.core.cache import cache
-from django.core.mail import send_mail
+from django.db import router
 
+from auths import sessions
+from auths.cache import get_redis
 from auths.models import ProjectUser
+from auths.authentication import bump_token_version, check_token_version
+from auths.tokens import get_minter
+
+
+class RegistrationThrottled(Exception):
+
+    def __init__(self, message, retry_after):
+
+        super().__init__(message)
+
+        self.retry_after = retry_after
+
+
+class PendingRegistrationStore:
+
+    """
+    Pending registrations, at most one per normalized email.
+
+    A code key holds the compact payload and an email key points at the
+    current code. Registering again or resending replaces the previous code
+    under a per-email lock. A sorted set of pending emails, scored by expiry,
+    enforces PENDING_REGISTRATION_LIMIT, and a per-email cooldown bounds how
+    often codes are sent.
+    """
+
+    FIELDS = ('nickname', 'username', 'email', 'password')
+
+    REGISTRY_KEY = 'auth:register:pending'
+
+    @staticmethod
+    def normalize_email(email):
+
+        return email.strip().lower()
+
+    @staticmethod
+    def get_code_key(code):
+
+        return f'auth:register:code:{code}'
+
+    @staticmethod
+    def get_email_key(email):
+
+        return f'auth:register:email:{email}'
+
+    @classmethod
+    def encode(cls, user_data):
+
+        return json.dumps([user_data[field] for field in cls.FIELDS], separators=(',', ':'))
+
+    @classmethod
+    def decode(cls, payload):
+
+        return dict(zip(cls.FIELDS, json.loads(payload)))
+
+    @classmethod
+    def get(cls, code):
+
+        payload = cache.get(cls.get_code_key(code))
+
+        return payload and cls.decode(payload)
+
+    @classmethod
+    def get_by_email(cls, email):
+
+        code = cache.get(cls.get_email_key(cls.normalize_email(email)))
+
+        return code and cls.get(code)
+
+    @classmethod
+    def check_capacity(cls, email):
+
+        pipe = get_redis(cls.REGISTRY_KEY).pipeline(transaction=False)
+        pipe.zremrangebyscore(cls.REGISTRY_KEY, '-inf', time.time())
+        pipe.zcard(cls.REGISTRY_KEY)
+        pipe.zscore(cls.REGISTRY_KEY, email)
+        _, pending, already_pending = pipe.execute()
+
+        if already_pending is None and pending >= settings.PENDING_REGISTRATION_LIMIT:
+
+            raise RegistrationThrottled(
+                'Too many pending registrations, please try again later.',
+                retry_after=settings.PENDING_REGISTRATION_TTL
+            )
+
+    @classmethod
+    def replace(cls, user_data):
+
+        """Stores a pending registration with a new code, discarding the previous one. Returns the code."""
+
+        email = cls.normalize_email(user_data['email'])
+
+        timeout = settings.PENDING_REGISTRATION_TTL
+
+        cls.check_capacity(email)
+
+        if not cache.add(f'auth:register:cooldown:{email}', 1, timeout=settings.PENDING_REGISTRATION_COOLDOWN):
+
+            raise RegistrationThrottled(
+                'A code was sent recently, please wait before requesting another one.',
+                retry_after=settings.PENDING_REGISTRATION_COOLDOWN
+            )
+
+        payload = cls.encode(user_data)
+
+        with cache.lock(f'auth:register:lock:{email}', timeout=5, blocking_timeout=5):
+
+            code = random.randint(100000, 999999)
+
+            # Never overwrite someone else's pending code.
+            while not cache.add(cls.get_code_key(code), payload, timeout=timeout):
+
+                code = random.randint(100000, 999999)
+
+            previous_code = cache.get(cls.get_email_key(email))
+
+            cache.set(cls.get_email_key(email), code, timeout=timeout)
+
+            if previous_code is not None:
+
+                cache.delete(cls.get_code_key(previous_code))
+
+        get_redis(cls.REGISTRY_KEY).zadd(cls.REGISTRY_KEY, {email: time.time() + timeout})
+
+        return code
+
+    @classmethod
+    def discard(cls, code, email):
+
+        email = cls.normalize_email(email)
+
+        with cache.lock(f'auth:register:lock:{email}', timeout=5, blocking_timeout=5):
+
+            cache.delete(cls.get_code_key(code))
+
+            if cache.get(cls.get_email_key(email)) == code:
+
+                cache.delete(cls.get_email_key(email))
+
+                get_redis(cls.REGISTRY_KEY).zrem(cls.REGISTRY_KEY, email)
+
 
 class RegistrationService:
 
@@ -17,9 +166,13 @@ class RegistrationService:
 
         self.user_data = user_data
 
-        self.code = random.randint(100000, 999999)
+        self.code = None
 
     def send_confirmation_email(self):
+
+        # Imported lazily, the mail stack is only needed when an email is sent.
+        from django.core.mail import send_mail
+
         send_mail(
             'Registration code',
             f"Here is the code for registration: {self.code} and here is the link for this action: http://localhost:4200/confirm",
@@ -29,7 +182,7 @@ class RegistrationService:
 
     def cache_user_data(self):
 
-        cache.set(self.code, self.user_data, timeout=180)
+        self.code = PendingRegistrationStore.replace(self.user_data)
 
 
 class RegisterUser:
@@ -45,6 +198,23 @@ class RegisterUser:
         registration_service.send_confirmation_email()
 
 
+class ResendRegistrationCode:
+
+    def __init__(self, email):
+
+        self.email = email
+
+    def execute(self):
+
+        user_data = PendingRegistrationStore.get_by_email(self.email)
+
+        if not user_data:
+
+            raise ValueError("No pending registration for this email.")
+
+        RegisterUser(user_data).execute()
+
+
 class RegistrationConfirmationService:
 
     def __init__(self, code, user_data):
@@ -53,7 +223,7 @@ class RegistrationConfirmationService:
 
     def check_code(self):
 
-        cached_data = cache.get(self.code)
+        cached_data = PendingRegistrationStore.get(self.code)
         if not cached_data:
             raise ValueError("Invalid code")
         return cached_data
@@ -80,7 +250,7 @@ class RegistrationConfirmationService:
         user_data = self.check_code()
         self.check_if_user_exists()
         new_user = self.create_user()
-        cache.delete(self.code)
+        PendingRegistrationStore.discard(self.code, user_data['email'])
         return new_user
 
 
@@ -89,48 +259,57 @@ class AuthenticationService:
     def __init__(self, user_data):
         self.nickname = user_data.get('nickname')
         self.password = user_data.get('password')
+        self.user = user_data.get('user')
+        self.token_time = user_data.get('token_time') or 0
+        self.session_id = None
+        self.session_expires_at = None
 
     def validate_user(self):
 
-        try:
+        # Already verified by AuthorizationSerializer.
+        if self.user is not None:
 
-            user = ProjectUser.objects.get(email=self.nickname)
+            return self.user
 
-        except Exception:
+        user = ProjectUser.objects.get_for_login(self.nickname)
 
-            try:
+        if user is None:
 
-                user = ProjectUser.objects.get(nickname=self.nickname)
+            raise Exception('User does not exist.')
 
-            except Exception:
+        if not user.check_password(self.password) or not user.is_active:
 
-                raise Exception('User does not exist.')
-
-        try:
+            raise Exception('Wrong password.')
 
-            user = authenticate(nickname=user, password=self.password)
+        return user
 
-        except Exception:
+    def generate_tokens(self, user):
 
-            try:
+        if settings.AUTH_OPAQUE_REFRESH_TOKENS:
 
-                user = authenticate(nickname=user, password=self.password)
+            access_token, _ = get_minter().mint_access({
+                api_settings.USER_ID_CLAIM: user.pk,
+                settings.AUTH_TOKEN_VERSION_CLAIM: user.token_version,
+            })
 
-            except Exception:
+            self.session_id = uuid.uuid4().hex
 
-                raise Exception('Wrong password.')
+            handle = OpaqueRefreshTokenService.issue(user, self.token_time, self.session_id)
 
-        if not user:
+            self.session_expires_at = int(time.time() + api_settings.REFRESH_TOKEN_LIFETIME.total_seconds())
 
-            raise Exception('Wrong password.')
+            return handle, access_token
 
-        return user
+        # The version claim is copied into the access token as well.
+        refresh_token, access_token, claims = get_minter().mint_pair(
+            user, **{settings.AUTH_TOKEN_VERSION_CLAIM: user.token_version}
+        )
 
-    def generate_tokens(self, user):
+        self.session_id = claims[api_settings.JTI_CLAIM]
 
-        refresh = RefreshToken.for_user(user)
+        self.session_expires_at = claims['exp']
 
-        return str(refresh), str(refresh.access_token)
+        return refresh_token, access_token
 
     def execute(self):
 
@@ -146,12 +325,19 @@ class RequestPasswordRecoveryService:
         self.user_data = user_data
         self.recovery_code = random.randint(100000, 999999)
 
+    @staticmethod
+    def get_cache_key(recovery_code):
+
+        return f'auth:recovery:{recovery_code}'
+
     def cache_recovery_code(self):
 
-        cache.set(self.recovery_code, self.user_data, timeout=180)
+        cache.set(self.get_cache_key(self.recovery_code), self.user_data, timeout=180)
 
     def send_recovery_email(self):
 
+        from django.core.mail import send_mail
+
         send_mail(
             'Password Recovery Code',
             f"Here is the code for password recovery: {self.recovery_code} and here is the link for this action: http://localhost:4200/recovery",
@@ -177,7 +363,7 @@ class PasswordRecoveryService:
 
     def validate_code(self):
 
-        user_data = cache.get(self.recovery_code)
+        user_data = cache.get(RequestPasswordRecoveryService.get_cache_key(self.recovery_code))
 
         if not user_data:
 
@@ -199,17 +385,342 @@ class PasswordRecoveryService:
 
         user.set_password(self.new_password)
 
-        user.save()
+        user.save(update_fields=['password'])
+
+        # Logs the user out everywhere.
+        bump_token_version(user.pk)
 
     def execute(self):
 
         user_data = self.validate_code()
         user = self.get_user(user_data['email'])
         self.change_password(user)
-        cache.delete(self.recovery_code)
+        cache.delete(RequestPasswordRecoveryService.get_cache_key(self.recovery_code))
         return user
 
 
+class TokenRefreshService:
+
+    """
+    Issues access tokens for a refresh token.
+
+    The access token minted for a refresh `jti` is cached until shortly
+    before it expires, so concurrent refreshes from several tabs or workers
+    reuse it instead of signing a new one. A short lock makes sure only one
+    of them does the signing.
+    """
+
+    def __init__(self, refresh_token):
+
+        self.refresh_token = refresh_token
+
+        self.user_id = None
+
+    def get_cache_key(self, token):
+
+        return f'auth:refresh:access:{token[api_settings.JTI_CLAIM]}'
+
+    def mint_access_token(self, token):
+
+        return get_minter().mint_access(token.payload)
+
+    def wait_for_access_token(self, cache_key):
+
+        deadline = time.monotonic() + settings.REFRESH_COALESCING_WAIT_TIMEOUT
+
+        while time.monotonic() < deadline:
+
+            time.sleep(settings.REFRESH_COALESCING_POLL_INTERVAL)
+
+            minted = cache.get(cache_key)
+
+            if minted is not None:
+
+                return minted
+
+        return None
+
+    def execute(self):
+
+        """Returns the access token and its expiry as a unix timestamp."""
+
+        token = RefreshToken(self.refresh_token)
+
+        check_token_version(token.payload)
+
+        self.user_id = token.get(api_settings.USER_ID_CLAIM)
+
+        if sessions.is_revoked(self.user_id, token.get(api_settings.JTI_CLAIM)):
+
+            raise TokenError('Token has been revoked')
+
+        cache_key = self.get_cache_key(token)
+
+        minted = cache.get(cache_key)
+
+        if minted is not None:
+
+            return minted
+
+        lock_key = f'{cache_key}:lock'
+
+        if not cache.add(lock_key, 1, timeout=settings.REFRESH_COALESCING_LOCK_TIMEOUT):
+
+            minted = self.wait_for_access_token(cache_key)
+
+            if minted is not None:
+
+                return minted
+
+            # The lock holder is slow or gone, sign our own token.
+            return self.mint_access_token(token)
+
+        try:
+
+            minted = self.mint_access_token(token)
+
+            timeout = int(minted[1] - time.time()) - settings.REFRESH_COALESCING_MARGIN
+
+            if timeout > 0:
+
+                cache.set(cache_key, minted, timeout=timeout)
+
+            return minted
+
+        finally:
+
+            cache.delete(lock_key)
+
+
+class OpaqueRefreshTokenService:
+
+    """
+    Server-side refresh state for AUTH_OPAQUE_REFRESH_TOKENS mode.
+
+    The refreshToken cookie holds a short random handle. The refresh state
+    lives in Redis under a digest of the handle, with the refresh token
+    lifetime as TTL. Resolving it is one GET and revoking it is one DEL.
+    """
+
+    def __init__(self, refresh_token):
+
+        self.refresh_token = refresh_token
+
+        self.user_id = None
+
+    @staticmethod
+    def get_cache_key(handle):
+
+        return f'auth:refresh:handle:{hashlib.sha256(handle.encode()).hexdigest()}'
+
+    @classmethod
+    def issue(cls, user, token_time=0, session_id=None):
+
+        handle = secrets.token_urlsafe(24)
+
+        lifetime = int(api_settings.REFRESH_TOKEN_LIFETIME.total_seconds())
+
+        cache.set(cls.get_cache_key(handle), {
+            'user_id': user.pk,
+            'version': user.token_version,
+            'expires_at': int(time.time()) + lifetime,
+            'token_time': token_time,
+            'session_id': session_id,
+        }, timeout=lifetime)
+
+        return handle
+
+    @classmethod
+    def resolve(cls, handle):
+
+        return cache.get(cls.get_cache_key(handle))
+
+    @staticmethod
+    def get_payload(state):
+
+        """Claims equivalent to a JWT refresh token for the given refresh state."""
+
+        return {
+            api_settings.USER_ID_CLAIM: state['user_id'],
+            api_settings.JTI_CLAIM: state.get('session_id'),
+            settings.AUTH_TOKEN_VERSION_CLAIM: state['version'],
+        }
+
+    @classmethod
+    def revoke(cls, handle):
+
+        cache.delete(cls.get_cache_key(handle))
+
+    def execute(self):
+
+        """Returns a new access token and its expiry as a unix timestamp."""
+
+        state = self.resolve(self.refresh_token)
+
+        if state is None:
+
+            raise TokenError('Token is invalid or expired')
+
+        check_token_version(self.get_payload(state))
+
+        self.user_id = state['user_id']
+
+        if sessions.is_revoked(self.user_id, state.get('session_id')):
+
+            raise TokenError('Token has been revoked')
+
+        return get_minter().mint_access(self.get_payload(state))
+
+
+def get_refresh_service(refresh_token):
+
+    """Returns the refresh service of the configured refresh token mode."""
+
+    if settings.AUTH_OPAQUE_REFRESH_TOKENS:
+
+        return OpaqueRefreshTokenService(refresh_token)
+
+    return TokenRefreshService(refresh_token)
+
+
+def revoke_refresh_token(refresh_token):
+
+    """Invalidates an opaque refresh token. JWT refresh tokens expire on their own."""
+
+    if refresh_token and settings.AUTH_OPAQUE_REFRESH_TOKENS:
+
+        OpaqueRefreshTokenService.revoke(refresh_token)
+
+
+def get_refresh_token_session(refresh_token):
+
+    """Returns (user id, session id) of a valid refresh token, (None, None) otherwise."""
+
+    if not refresh_token:
+
+        return None, None
+
+    if settings.AUTH_OPAQUE_REFRESH_TOKENS:
+
+        state = OpaqueRefreshTokenService.resolve(refresh_token)
+
+        if state is None:
+
+            return None, None
+
+        payload = OpaqueRefreshTokenService.get_payload(state)
+
+    else:
+
+        try:
+
+            payload = RefreshToken(refresh_token).payload
+
+        except TokenError:
+
+            return None, None
+
+    user_id = payload.get(api_settings.USER_ID_CLAIM)
+
+    session_id = payload.get(api_settings.JTI_CLAIM)
+
+    try:
+
+        check_token_version(payload)
+
+    except TokenError:
+
+        return None, None
+
+    if sessions.is_revoked(user_id, session_id):
+
+        return None, None
+
+    return user_id, session_id
+
+
+def get_refresh_token_user_id(refresh_token):
+
+    """Returns the user id of a valid refresh token, None otherwise."""
+
+    return get_refresh_token_session(refresh_token)[0]
+
+
+def refresh_after(expires_at):
+
+    """Seconds until a client should refresh an access token expiring at `expires_at`."""
+
+    return max(int(expires_at - time.time()) - settings.REFRESH_COALESCING_MARGIN, 0)
+
+
+class ProfileService:
+
+    """
+    Profile of the signed-in user, cached in Redis with its ETag.
+
+    The ETag is a digest of the profile data, so it changes exactly when the
+    profile does. The cache entry is dropped whenever the user is saved.
+    """
+
+    def __init__(self, user_id):
+
+        self.user_id = user_id
+
+    @staticmethod
+    def get_cache_key(user_id):
+
+        return f'auth:profile:{user_id}'
+
+    @classmethod
+    def invalidate(cls, user_id):
+
+        cache.delete(cls.get_cache_key(user_id))
+
+    def load(self):
+
+        # The primary, a lagging replica could cache a profile older than the last save.
+        user = (
+            ProjectUser.objects
+            .using(router.db_for_write(ProjectUser))
+            .only('username', 'nickname', 'email')
+            .get(pk=self.user_id)
+        )
+
+        data = {
+            "username": user.username,
+            "nickname": user.nickname,
+            "pk": user.pk,
+            "email": user.email,
+        }
+
+        digest = hashlib.sha256(json.dumps(data, sort_keys=True).encode()).hexdigest()[:32]
+
+        return {'etag': f'"{digest}"', 'data': data}
+
+    def execute(self):
+
+        """
+        Returns {'etag': ..., 'data': ...}, reading Postgres only on a cache miss.
+
+        The miss fills the cache with add(), so a concurrent fill never
+        replaces an entry that is already there.
+        """
+
+        key = self.get_cache_key(self.user_id)
+
+        profile = cache.get(key)
+
+        if profile is None:
+
+            profile = self.load()
+
+            if not cache.add(key, profile, timeout=settings.PROFILE_CACHE_TTL):
+
+                profile = cache.get(key, profile)
+
+        return profile
+
+
 def set_tokens_in_cookies(response, refresh_token, token_time=3600*24*21):
 
     response.set_cookie(
@@ -1,14 +1,16 @@
-from rest_framework_simplejwt.authentication import JWTAuthentication
-from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework import generics, status, permissions
 from rest_framework.response import Response
 from rest_framework.decorators import api_view
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.settings import api_settings
 
-from django.core.cache import cache
+from django.conf import settings
 from django.views.decorators.csrf import csrf_exempt
 
 from auths.serializers import (
     RegistrationSerializer,
+    RegistrationResendSerializer,
+    AvailabilitySerializer,
     AuthorizationSerializer,
     RegistrationConfirmSerializer,
     RequestPasswordRecoverySerializer,
@@ -21,12 +23,27 @@ from auths.utils import (
     AuthenticationService,
     RequestPasswordRecoveryService,
     PasswordRecoveryService,
+    PendingRegistrationStore,
+    ProfileService,
+    RegistrationThrottled,
+    ResendRegistrationCode,
+    get_refresh_service,
+    get_refresh_token_session,
+    revoke_refresh_token,
+    refresh_after,
     set_tokens_in_cookies,
 )
-from auths.models import ProjectUser
+from auths.models import ProjectUser, AuthEvent
+from auths.audit import record_event
+from auths import activity, sessions
+from auths.bloom import is_taken
+from auths.sockets import revoke_session_sockets, revoke_user_sockets
+from auths.authentication import VersionedJWTAuthentication
+from auths.admission import AdmissionControlMixin
+from auths.idempotency import IdempotencyMixin
 
 
-class Register_User(generics.CreateAPIView):
+class Register_User(IdempotencyMixin, AdmissionControlMixin, generics.CreateAPIView):
 
     """
     Endpoint for user registration.
@@ -35,6 +52,8 @@ class Register_User(generics.CreateAPIView):
 
     serializer_class = RegistrationSerializer
 
+    admission_scope = 'register'
+
     def create(self, request, *args, **kwargs):
 
         serializer = self.get_serializer(data=request.data)
@@ -45,7 +64,15 @@ class Register_User(generics.CreateAPIView):
 
             registration_service = RegisterUser(user_data)
 
-            code = registration_service.execute()
+            try:
+
+                code = registration_service.execute()
+
+            except RegistrationThrottled as e:
+
+                return throttled_response(e)
+
+            record_event(AuthEvent.REGISTER, request, identifier=user_data.get('email'))
 
             return Response({"message": "Please check your email for confirmation with code"}, status=status.HTTP_200_OK)
 
@@ -75,7 +102,81 @@ class Register_User(generics.CreateAPIView):
         )
 
 
-class Register_Confirm(generics.GenericAPIView):
+def throttled_response(error):
+
+    response = Response({"errors": {"message": str(error)}}, status=status.HTTP_429_TOO_MANY_REQUESTS)
+
+    response['Retry-After'] = error.retry_after
+
+    return response
+
+
+class Register_Resend(IdempotencyMixin, AdmissionControlMixin, generics.GenericAPIView):
+
+    """
+    Endpoint for resending the registration code.
+    Replaces the pending code of the email with a new one and sends it.
+    """
+
+    serializer_class = RegistrationResendSerializer
+
+    admission_scope = 'register'
+
+    def post(self, request, *args, **kwargs):
+
+        serializer = self.get_serializer(data=request.data)
+
+        if serializer.is_valid():
+
+            try:
+
+                ResendRegistrationCode(serializer.validated_data['email']).execute()
+
+            except RegistrationThrottled as e:
+
+                return throttled_response(e)
+
+            except ValueError as e:
+
+                return Response({"errors": {"message": str(e)}}, status=status.HTTP_400_BAD_REQUEST)
+
+            return Response({"message": "Please check your email for confirmation with code"}, status=status.HTTP_200_OK)
+
+        formatted_errors = {field: error[0] for field, error in serializer.errors.items()}
+
+        return Response({"errors": formatted_errors}, status=status.HTTP_400_BAD_REQUEST)
+
+
+class Check_Availability(generics.GenericAPIView):
+
+    """
+    Endpoint for checking whether a nickname or email is still free.
+    Answered from a Bloom filter of taken values, so most checks never reach
+    Postgres; only possible hits are confirmed with a query.
+    """
+
+    serializer_class = AvailabilitySerializer
+
+    authentication_classes = []
+
+    permission_classes = [permissions.AllowAny]
+
+    def get(self, request, *args, **kwargs):
+
+        serializer = self.get_serializer(data=request.query_params)
+
+        if serializer.is_valid():
+
+            available = {field: not is_taken(field, value) for field, value in serializer.validated_data.items()}
+
+            return Response({"available": available}, status=status.HTTP_200_OK)
+
+        formatted_errors = {field: error[0] for field, error in serializer.errors.items()}
+
+        return Response({"errors": formatted_errors}, status=status.HTTP_400_BAD_REQUEST)
+
+
+class Register_Confirm(AdmissionControlMixin, generics.GenericAPIView):
 
     """
     Endpoint for confirming registration with a code.
@@ -84,6 +185,8 @@ class Register_Confirm(generics.GenericAPIView):
 
     serializer_class = RegistrationConfirmSerializer
 
+    admission_scope = 'register_confirm'
+
     def post(self, request, *args, **kwargs):
 
         serializer = self.get_serializer(data=request.data)
@@ -92,14 +195,15 @@ class Register_Confirm(generics.GenericAPIView):
 
             code = serializer.data.get('code')
 
-            user_data = cache.get(code)
+            user_data = PendingRegistrationStore.get(code)
 
             if user_data:
 
                 try:
 
                     confirmation_service = RegistrationConfirmationService(code, user_data)
-                    confirmation_service.execute()
+                    new_user = confirmation_service.execute()
+                    record_event(AuthEvent.REGISTER_CONFIRM, request, user_id=new_user.pk)
                     return Response({"message": "Registration successfully."}, status=status.HTTP_200_OK)
 
                 except ValueError as e:
@@ -113,7 +217,7 @@ class Register_Confirm(generics.GenericAPIView):
         return Response({"errors": {"message": "Wrong code."}}, status=status.HTTP_400_BAD_REQUEST)
 
 
-class Login_User(generics.GenericAPIView):
+class Login_User(AdmissionControlMixin, generics.GenericAPIView):
 
     """
     Endpoint for user authentication.
@@ -124,12 +228,16 @@ class Login_User(generics.GenericAPIView):
 
     permission_classes = [permissions.AllowAny]
 
+    admission_scope = 'login'
+
     def post(self, request, *args, **kwargs):
 
         serializer = self.get_serializer(data=request.data)
 
         if not serializer.is_valid():
 
+            record_event(AuthEvent.LOGIN_FAILED, request, identifier=request.data.get('nickname', ''))
+
             errors = serializer.errors
 
             nickname_error = errors.get('nickname', [])
@@ -150,42 +258,32 @@ class Login_User(generics.GenericAPIView):
 
             return Response({'errors': errors}, status=status.HTTP_400_BAD_REQUEST)
         user_data = serializer.validated_data
-        try:
-            token_time = serializer.validated_data.get('token_time')
-        except:
-            token_time = 0
 
-            if not token_time:
-                token_time = 0
+        token_time = user_data.get('token_time') or 0
 
-            auth_service = AuthenticationService(user_data)
+        auth_service = AuthenticationService(user_data)
 
         try:
 
             user, refresh_token, access_token = auth_service.execute()
 
-            try:
-
-                user_data = ProjectUser.objects.get(email=str(user))
+            record_event(AuthEvent.LOGIN, request, user_id=user.pk)
 
-            except ProjectUser.DoesNotExist:
+            evicted = sessions.add(
+                user.pk, auth_service.session_id, auth_service.session_expires_at, user.token_version, request
+            )
 
-                try:
-
-                    user_data = ProjectUser.objects.get(nickname=str(user))
-
-                except:
-
-                    raise serializers.ValidationError({"nickname": "User does not exist."})
+            revoke_session_sockets(*evicted)
 
+            activity.touch(user.pk)
 
             response = Response({
                 'access_token': access_token,
                 "user": {
-                    "username": user_data.username,
-                    "nickname": user_data.nickname,
-                    "pk": user_data.pk,
-                    "email": user_data.email,
+                    "username": user.username,
+                    "nickname": user.nickname,
+                    "pk": user.pk,
+                    "email": user.email,
                     "refresh_token_time": token_time
                 }
             })
@@ -197,19 +295,35 @@ class Login_User(generics.GenericAPIView):
 
         except Exception as e:
 
+            record_event(AuthEvent.LOGIN_FAILED, request, identifier=user_data.get('nickname'))
+
             return Response({'errors': {'error': str(e)}}, status=status.HTTP_401_UNAUTHORIZED)
 
 class Logout_User(generics.GenericAPIView):
 
     '''Logoutes a user from his session.
 
-        [Deletes refreshToken cookie]
+        [Deletes refreshToken cookie, revokes it in opaque refresh token mode]
     '''
 
     serializer_class = LogoutResponseSerializer
 
     def post(self, request, *args, **kwargs):
 
+        refresh_token = request.COOKIES.get('refreshToken')
+
+        user_id, session_id = get_refresh_token_session(refresh_token)
+
+        record_event(AuthEvent.LOGOUT, request, user_id=user_id)
+
+        revoke_refresh_token(refresh_token)
+
+        if user_id is not None and session_id:
+
+            sessions.revoke(user_id, session_id)
+
+            revoke_session_sockets(session_id)
+
         response = Response({
             "message": "User logget out successfully.",
         }, status=status.HTTP_200_OK)
@@ -222,6 +336,51 @@ class Logout_User(generics.GenericAPIView):
         return response
 
 
+class User_Sessions(generics.GenericAPIView):
+
+    """
+    Endpoint listing the active sessions (devices) of the signed-in user.
+    The session of the request's refreshToken cookie is marked as current.
+    """
+
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+
+        _, current_session_id = get_refresh_token_session(request.COOKIES.get('refreshToken'))
+
+        user_sessions = sessions.list_sessions(request.user.pk, version=request.user.token_version)
+
+        for session in user_sessions:
+
+            session['current'] = session['id'] == current_session_id
+
+        return Response({"sessions": user_sessions}, status=status.HTTP_200_OK)
+
+
+class Revoke_User_Session(generics.GenericAPIView):
+
+    """
+    Endpoint revoking one session of the signed-in user.
+    Its refresh token stops working at once; access tokens already issued
+    for it run out within ACCESS_TOKEN_LIFETIME.
+    """
+
+    permission_classes = [permissions.IsAuthenticated]
+
+    def delete(self, request, session_id, *args, **kwargs):
+
+        if not sessions.revoke(request.user.pk, session_id):
+
+            return Response({"errors": {"message": "Session does not exist."}}, status=status.HTTP_404_NOT_FOUND)
+
+        revoke_session_sockets(session_id)
+
+        record_event(AuthEvent.LOGOUT, request, user_id=request.user.pk, identifier=session_id)
+
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
 @csrf_exempt
 @api_view(['POST'])
 def refresh_token_view(request):
@@ -234,20 +393,28 @@ def refresh_token_view(request):
 
     try:
 
-        token = RefreshToken(refresh_token)
+        refresh_service = get_refresh_service(refresh_token)
 
-        access_token = token.access_token
+        access_token, expires_at = refresh_service.execute()
 
-        return Response({
-            'access_token': str(access_token)
+        activity.touch(refresh_service.user_id)
+
+        response = Response({
+            'access_token': access_token
         })
 
+        if settings.REFRESH_AFTER_HEADER:
+
+            response['X-Refresh-After'] = refresh_after(expires_at)
+
+        return response
+
     except Exception as e:
 
         return Response({'error': str(e)}, status=status.HTTP_401_UNAUTHORIZED)
 
 
-class Request_Password_Recovery(generics.GenericAPIView):
+class Request_Password_Recovery(IdempotencyMixin, generics.GenericAPIView):
 
     """
     Endpoint for requesting a password recovery code.
@@ -272,8 +439,6 @@ class Request_Password_Recovery(generics.GenericAPIView):
 
                 recovery_code = recovery_service.execute()
 
-                request.session['user_data'] = user_data
-
                 return Response({"message": "We sent you a password recovery code."}, status=status.HTTP_200_OK)
 
             except Exception as e:
@@ -288,7 +453,7 @@ class Request_Password_Recovery(generics.GenericAPIView):
         return Response({"errors": formatted_errors}, status=status.HTTP_400_BAD_REQUEST)
 
 
-class Password_Recovery(generics.GenericAPIView):
+class Password_Recovery(AdmissionControlMixin, generics.GenericAPIView):
 
     """
     Endpoint for submitting the password recovery code and new password.
@@ -298,6 +463,8 @@ class Password_Recovery(generics.GenericAPIView):
 
     serializer_class = PasswordRecoverySerializer
 
+    admission_scope = 'password_recovery'
+
     def post(self, request, *args, **kwargs):
 
         serializer = self.get_serializer(data=request.data)
@@ -314,6 +481,10 @@ class Password_Recovery(generics.GenericAPIView):
 
                 user = recovery_service.execute()
 
+                record_event(AuthEvent.PASSWORD_CHANGE, request, user_id=user.pk)
+
+                revoke_user_sockets(user.pk)
+
                 return Response({"message": "Password successfully changed."}, status=status.HTTP_200_OK)
 
             except ValueError as e:
@@ -321,3 +492,63 @@ class Password_Recovery(generics.GenericAPIView):
                 return Response({"errors": {"message": str(e)}}, status=status.HTTP_400_BAD_REQUEST)
 
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
+class Current_User(generics.GenericAPIView):
+
+    """
+    Endpoint returning the profile of the signed-in user.
+
+    The identity comes from the access token alone and the profile from
+    cache, with a strong ETag. A matching If-None-Match is answered with
+    304 without touching Postgres.
+    """
+
+    # The token is validated in get(), without loading the user.
+    authentication_classes = []
+
+    permission_classes = [permissions.AllowAny]
+
+    def get_user_id(self, request):
+
+        authentication = VersionedJWTAuthentication()
+
+        header = authentication.get_header(request)
+
+        raw_token = header and authentication.get_raw_token(header)
+
+        if raw_token is None:
+
+            raise AuthenticationFailed()
+
+        return authentication.get_validated_token(raw_token)[api_settings.USER_ID_CLAIM]
+
+    def get(self, request, *args, **kwargs):
+
+        try:
+
+            user_id = self.get_user_id(request)
+
+            profile = ProfileService(user_id).execute()
+
+        except AuthenticationFailed:
+
+            return Response({"errors": {"message": "Access token is missing or invalid."}}, status=status.HTTP_401_UNAUTHORIZED)
+
+        except ProjectUser.DoesNotExist:
+
+            return Response({"errors": {"message": "User does not exist."}}, status=status.HTTP_401_UNAUTHORIZED)
+
+        if profile['etag'] in request.headers.get('If-None-Match', ''):
+
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+
+        else:
+
+            response = Response(profile['data'], status=status.HTTP_200_OK)
+
+        response['ETag'] = profile['etag']
+
+        response['Cache-Control'] = 'private, no-cache'
+
+        return response
@@ -0,0 +1,158 @@
+import importlib
+import logging
+import time
+
+from django.conf import settings
+
+
+logger = logging.getLogger(__name__)
+
+# Modules a worker otherwise imports lazily while serving its first requests.
+WARMUP_IMPORTS = [
+    'rest_framework.views',
+    'rest_framework.generics',
+    'rest_framework.renderers',
+    'rest_framework.parsers',
+    'rest_framework.negotiation',
+    'rest_framework_simplejwt.authentication',
+    'rest_framework_simplejwt.state',
+    'django.core.mail',
+    'auths.urls',
+    'auths.views',
+    'auths.serializers',
+    'auths.utils',
+]
+
+
+def import_modules():
+
+    for module in WARMUP_IMPORTS:
+
+        importlib.import_module(module)
+
+    from django.urls import get_resolver
+
+    get_resolver().url_patterns
+
+
+def open_database_connections():
+
+    from django.db import connections
+
+    # Only persistent or pooled connections outlive close_old_connections at
+    # the first request_started, the others would be closed unused.
+    for alias in connections:
+
+        database = connections.settings[alias]
+
+        if not database.get('CONN_MAX_AGE') and not database.get('OPTIONS', {}).get('pool'):
+
+            continue
+
+        connections[alias].ensure_connection()
+
+
+def open_cache_connections():
+
+    from django.core.cache import caches
+
+    for alias in settings.CACHES:
+
+        caches[alias].get('auth:warmup')
+
+
+def prime_token_backend():
+
+    from rest_framework_simplejwt.settings import api_settings
+    from rest_framework_simplejwt.tokens import AccessToken, UntypedToken
+
+    token = AccessToken()
+
+    token[api_settings.USER_ID_CLAIM] = 0
+
+    UntypedToken(str(token))
+
+    from auths.tokens import get_minter
+
+    get_minter()
+
+
+def prime_validators():
+
+    from django.contrib.auth.password_validation import get_default_password_validators
+
+    from auths.serializers import EMAIL_PATTERN, PASSWORD_PATTERN
+
+    # Loads the common password list and builds the validators once.
+    get_default_password_validators()
+
+    EMAIL_PATTERN.match('warm-up@example.com')
+
+    PASSWORD_PATTERN.match('warm-up-1!')
+
+
+def prime_hasher():
+
+    from django.contrib.auth.hashers import get_hasher
+
+    # One cheap iteration initializes the hasher and its hashlib backend
+    # without paying for a full hash.
+    hasher = get_hasher()
+
+    if hasattr(hasher, 'iterations'):
+
+        hasher.encode('warm-up', hasher.salt(), iterations=1)
+
+    else:
+
+        hasher.encode('warm-up', hasher.salt())
+
+
+STEPS = [
+    ('imports', import_modules),
+    ('database', open_database_connections),
+    ('cache', open_cache_connections),
+    ('token_backend', prime_token_backend),
+    ('validators', prime_validators),
+    ('hasher', prime_hasher),
+]
+
+
+def warm_up(connect=True):
+
+    """
+    Pays the first-request costs of a worker up front.
+
+    Run it once per worker process after fork. With `connect=False` the
+    database and cache connections are skipped, which makes it safe to call
+    in a process that forks workers afterwards. Returns the milliseconds
+    spent in each step; a failing step is logged and skipped.
+    """
+
+    timings = {}
+
+    started = time.perf_counter()
+
+    for name, step in STEPS:
+
+        if not connect and name in ('database', 'cache'):
+
+            continue
+
+        step_started = time.perf_counter()
+
+        try:
+
+            step()
+
+        except Exception:
+
+            logger.exception('Warm-up step %s failed', name)
+
+        timings[name] = round((time.perf_counter() - step_started) * 1000, 1)
+
+    timings['total'] = round((time.perf_counter() - started) * 1000, 1)
+
+    logger.info('Worker warm-up finished in %sms: %s', timings['total'], timings)
+
+    return timings
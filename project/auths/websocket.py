@@ -0,0 +1,66 @@
+from asgiref.sync import sync_to_async
+from channels.middleware import BaseMiddleware
+from channels.sessions import CookieMiddleware
+from django.contrib.auth.models import AnonymousUser
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from auths.authentication import check_token_version
+from auths.utils import get_refresh_token_session
+
+
+def resolve_identity(cookies):
+
+    """
+    Resolves (user id, session id) from the refreshToken cookie, or the user
+    id alone from an accessToken cookie if present.
+    """
+
+    user_id, session_id = get_refresh_token_session(cookies.get('refreshToken'))
+
+    if user_id is None and cookies.get('accessToken'):
+
+        try:
+
+            access_token = AccessToken(cookies['accessToken'])
+
+            check_token_version(access_token.payload)
+
+            user_id = access_token.get(api_settings.USER_ID_CLAIM)
+
+        except TokenError:
+
+            return None, None
+
+    return user_id, session_id
+
+
+class CookieTokenAuthMiddleware(BaseMiddleware):
+
+    """
+    Authenticates a WebSocket connection from its token cookies.
+
+    Tokens are validated once, when the connection is opened. The identity
+    is kept in the scope for the lifetime of the connection as scope['user']
+    (a TokenUser, no database access), scope['user_id'] and
+    scope['session_id'], the refresh session the socket belongs to (None
+    for sockets authenticated by an access token alone).
+    """
+
+    async def __call__(self, scope, receive, send):
+
+        user_id, session_id = await sync_to_async(resolve_identity)(scope.get('cookies', {}))
+
+        scope = dict(scope, user_id=user_id, session_id=session_id)
+
+        scope['user'] = AnonymousUser() if user_id is None else TokenUser({api_settings.USER_ID_CLAIM: user_id})
+
+        return await super().__call__(scope, receive, send)
+
+
+def CookieTokenAuthMiddlewareStack(inner):
+
+    return CookieMiddleware(CookieTokenAuthMiddleware(inner))
+
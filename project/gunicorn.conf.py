@@ -0,0 +1,8 @@
+# Picked up automatically when gunicorn is started from this directory.
+
+
+def post_worker_init(worker):
+
+    from auths.warmup import warm_up
+
+    warm_up()
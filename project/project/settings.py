@@ -3,6 +3,8 @@ from dotenv import load_dotenv
 from datetime import timedelta
 from pathlib import Path
 
+from corsheaders.defaults import default_headers
+
 load_dotenv()
 
 INSTALLED_APPS = [
@@ -35,6 +37,10 @@ USE_I18N = True
 USE_TZ = True
 
 MIDDLEWARE = [
+    'auths.middleware.ForwardAuthMiddleware',
+    'auths.middleware.CorsPreflightMiddleware',
+    'corsheaders.middleware.CorsMiddleware',
+    'auths.middleware.ReplicaPinningMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -42,7 +48,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    'corsheaders.middleware.CorsMiddleware',
+    'auths.middleware.ProfilingMiddleware',
 ]
 
 TEMPLATES = [
@@ -76,11 +82,46 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# PASSWORD HASHING
+# AUTH_PASSWORD_HASHER - pbkdf2, scrypt or argon2 (needs argon2-cffi). Hashes made by the
+# others or with other parameters still verify and are rehashed on the next login.
+# Measure parameters for the current hardware with `manage.py calibrate_hasher`
+
+AUTH_PASSWORD_HASHER = os.getenv('AUTH_PASSWORD_HASHER', 'pbkdf2')
+
+AUTH_PASSWORD_HASHER_PARAMS = {
+    'pbkdf2': {
+        'iterations': int(os.getenv('AUTH_PBKDF2_ITERATIONS', 870000)),
+    },
+    'scrypt': {
+        'work_factor': int(os.getenv('AUTH_SCRYPT_WORK_FACTOR', 2 ** 14)),
+        'block_size': int(os.getenv('AUTH_SCRYPT_BLOCK_SIZE', 8)),
+        'parallelism': int(os.getenv('AUTH_SCRYPT_PARALLELISM', 5)),
+    },
+    'argon2': {
+        'time_cost': int(os.getenv('AUTH_ARGON2_TIME_COST', 2)),
+        'memory_cost': int(os.getenv('AUTH_ARGON2_MEMORY_COST', 102400)),
+        'parallelism': int(os.getenv('AUTH_ARGON2_PARALLELISM', 8)),
+    },
+}
+
+AUTH_PASSWORD_HASHER_CLASSES = {
+    'pbkdf2': 'auths.hashers.PBKDF2PasswordHasher',
+    'scrypt': 'auths.hashers.ScryptPasswordHasher',
+    'argon2': 'auths.hashers.Argon2PasswordHasher',
+}
+
+# The first hasher hashes new passwords, the others only verify.
+PASSWORD_HASHERS = [
+    AUTH_PASSWORD_HASHER_CLASSES[AUTH_PASSWORD_HASHER],
+    *[path for name, path in AUTH_PASSWORD_HASHER_CLASSES.items() if name != AUTH_PASSWORD_HASHER],
+]
+
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
         'rest_framework.authentication.SessionAuthentication',
         'rest_framework.authentication.BasicAuthentication',
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'auths.authentication.VersionedJWTAuthentication',
 
     )
 }
@@ -107,6 +148,22 @@ CORS_ALLOW_METHODS = [
     'OPTIONS',
 ]
 
+CORS_ALLOW_HEADERS = (
+    *default_headers,
+    'idempotency-key',
+)
+
+CORS_EXPOSE_HEADERS = [
+    'X-Refresh-After',
+    'ETag',
+]
+
+# Preflights under this prefix are answered by auths.middleware.CorsPreflightMiddleware
+CORS_PREFLIGHT_PATH_PREFIX = '/auth/'
+
+# Seconds browsers may cache a preflight result (Chromium caps it at 7200)
+CORS_PREFLIGHT_MAX_AGE = int(os.getenv('CORS_PREFLIGHT_MAX_AGE', 60 * 60 * 24))
+
 WSGI_APPLICATION = 'project.wsgi.application'
 
 ROOT_URLCONF = 'project.urls'
@@ -131,17 +188,140 @@ SESSION_COOKIE_SAMESITE = 'None'
 SESSION_COOKIE_SECURE = False  # True
 
 #REDIS LIKE DB, CACHE
+# REDIS_URL - comma separated Redis nodes, keys are spread over them by consistent hashing.
+# REDIS_<POOL>_URLS move a pool of NAMESPACES to nodes of its own, unset pools stay on REDIS_URL.
+# Adding a node to a pool of n nodes reroutes about 1/(n + 1) of its keys, but moves no data:
+# rerouted revocations (auth:sessions:*, auth:token_version:*) would be lost and revoked
+# sessions work again. Resize a pool holding live refresh tokens only with rebalance_cache:
+#   1. manage.py rebalance_cache --pool <pool> --add <url>   (copies keys the new node will own)
+#   2. add the node to the pool's URLs and restart every worker
+#   3. manage.py rebalance_cache --pool <pool> --delete      (copies writes made during the rollout)
 
 CACHES = {
     'default': {
         'BACKEND': 'django_redis.cache.RedisCache',
-        'LOCATION': os.getenv('REDIS_URL', 'redis://localhost:6379'),
+        'LOCATION': os.getenv('REDIS_URL', 'redis://localhost:6379').split(','),
         'OPTIONS': {
-            'CLIENT_CLASS': 'django_redis.client.DefaultClient',
+            'CLIENT_CLASS': 'auths.cache.ShardedRedisClient',
+            'POOLS': {
+                'codes': list(filter(None, os.getenv('REDIS_CODES_URLS', '').split(','))),
+                'revocations': list(filter(None, os.getenv('REDIS_REVOCATIONS_URLS', '').split(','))),
+                'throttles': list(filter(None, os.getenv('REDIS_THROTTLES_URLS', '').split(','))),
+            },
+            # Key prefix -> pool, the longest matching prefix wins
+            'NAMESPACES': {
+                'auth:register:': 'codes',
+                'auth:recovery:': 'codes',
+                'auth:token_version:': 'revocations',
+                'auth:sessions:': 'revocations',
+                'auth:refresh:handle:': 'revocations',
+                'auth:register:cooldown:': 'throttles',
+                'admission:': 'throttles',
+            },
         }
     }
 }
 
+# PENDING REGISTRATIONS
+# One pending registration per email; TTL and COOLDOWN in seconds
+
+PENDING_REGISTRATION_TTL = 180
+PENDING_REGISTRATION_COOLDOWN = 30
+PENDING_REGISTRATION_LIMIT = int(os.getenv('PENDING_REGISTRATION_LIMIT', 100000))
+
+# IDEMPOTENCY KEYS (seconds)
+
+IDEMPOTENCY_KEY_TTL = 60 * 10
+IDEMPOTENCY_LOCK_TIMEOUT = 30
+IDEMPOTENCY_WAIT_TIMEOUT = 5
+IDEMPOTENCY_POLL_INTERVAL = 0.1
+
+# OPAQUE REFRESH TOKENS
+# The refreshToken cookie holds a random handle to refresh state kept in Redis
+# instead of a signed JWT, so logout revokes it. Switching invalidates issued refresh tokens
+
+AUTH_OPAQUE_REFRESH_TOKENS = os.getenv('AUTH_OPAQUE_REFRESH_TOKENS') == 'True'
+
+# TOKEN VERSIONS
+# Tokens carry the user's token version in this claim; bumping the version
+# (password recovery, force logout) invalidates all of them at once
+
+AUTH_TOKEN_VERSION_CLAIM = 'ver'
+TOKEN_VERSION_CACHE_TTL = 60 * 60 * 24
+
+# SESSIONS
+# Every login is indexed per user in Redis (GET /auth/sessions); above this many
+# sessions the ones expiring first are revoked
+
+AUTH_MAX_SESSIONS = int(os.getenv('AUTH_MAX_SESSIONS', 10))
+
+# Seconds a /auth/me profile stays cached (entries are also dropped when the user is saved)
+PROFILE_CACHE_TTL = 60 * 60
+
+# FORWARD AUTH
+# Reverse-proxy auth subrequests to this path are answered by
+# auths.middleware.ForwardAuthMiddleware; verdicts are cached per process
+
+FORWARD_AUTH_PATH = '/auth/verify'
+FORWARD_AUTH_COOKIE = 'accessToken'
+FORWARD_AUTH_CACHE_TTL = 5
+FORWARD_AUTH_CACHE_SIZE = 10000
+
+# REFRESH COALESCING (seconds)
+# Access tokens minted for a refresh token are reused until MARGIN seconds before they expire
+
+REFRESH_COALESCING_MARGIN = 5
+REFRESH_COALESCING_LOCK_TIMEOUT = 2
+REFRESH_COALESCING_WAIT_TIMEOUT = 0.5
+REFRESH_COALESCING_POLL_INTERVAL = 0.02
+
+# Adds X-Refresh-After (seconds until the next refresh is due) to refresh responses
+REFRESH_AFTER_HEADER = True
+
+# AUTH AUDIT LOG
+# Events are buffered in-process and written with one bulk_create every
+# FLUSH_INTERVAL seconds or BATCH_SIZE events, whichever comes first
+
+AUTH_AUDIT_FLUSH_INTERVAL = 0.5
+AUTH_AUDIT_BATCH_SIZE = 500
+AUTH_AUDIT_BUFFER_SIZE = 10000
+AUTH_AUDIT_RETENTION_DAYS = int(os.getenv('AUTH_AUDIT_RETENTION_DAYS', 90))
+
+# LAST SEEN TRACKING
+# Logins and refreshes are recorded in Redis and written to ProjectUser.last_login
+# by `manage.py flush_last_seen --loop`, LAST_SEEN_FLUSH_BATCH_SIZE users per UPDATE
+
+LAST_SEEN_FLUSH_INTERVAL = 60
+LAST_SEEN_FLUSH_BATCH_SIZE = 1000
+# Seconds of activity kept in Redis for active-user queries
+LAST_SEEN_RETENTION = 60 * 60 * 24
+
+# AVAILABILITY FILTER
+# Bloom filter of taken nicknames and emails behind /auth/availability, rebuilt with
+# `manage.py rebuild_availability_filter`. CAPACITY - expected number of users
+
+AVAILABILITY_BLOOM_CAPACITY = int(os.getenv('AVAILABILITY_BLOOM_CAPACITY', 1000000))
+AVAILABILITY_BLOOM_ERROR_RATE = 0.001
+
+# ON-DEMAND PROFILING
+# Requests with a signed X-Profile header (`manage.py profiling_token`) or, for staff,
+# a `profile` query parameter are profiled with cProfile. Disabled unless PROFILING_ENABLED=True
+
+PROFILING = {
+    'ENABLED': os.getenv('PROFILING_ENABLED') == 'True',
+    'HEADER': 'X-Profile',
+    'TOKEN_MAX_AGE': 60 * 60,
+    'SAMPLE_RATE': float(os.getenv('PROFILING_SAMPLE_RATE', 1.0)),
+    'DIRECTORY': os.getenv('PROFILING_DIRECTORY', os.path.join(BASE_DIR, '..', 'profiles')),
+    'KEEP': 50,
+}
+
+# WORKER WARM-UP
+# Warm up in AppConfig.ready, for servers that import the app in every worker
+# (runserver, uvicorn). gunicorn runs it from post_worker_init in gunicorn.conf.py
+
+AUTH_WARMUP_ON_READY = os.getenv('AUTH_WARMUP_ON_READY') == 'True'
+
 #POSTGTRESQL
 
 DATABASES = {
@@ -152,9 +332,39 @@ DATABASES = {
         'PASSWORD': os.getenv('POSTGRES_PASSWORD'),
         'HOST': 'db',
         'PORT': '5432',
+        # Keep connections across requests, so the one opened by the worker
+        # warm-up (auths.warmup) serves requests instead of being closed at
+        # the first request_started. Health checks replace dropped ones.
+        'CONN_MAX_AGE': int(os.getenv('POSTGRES_CONN_MAX_AGE', 600)),
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
+# READ REPLICAS
+# POSTGRES_REPLICA_HOSTS - comma separated hosts of streaming replicas of the primary
+
+DATABASE_REPLICAS = []
+
+for index, replica_host in enumerate(filter(None, os.getenv('POSTGRES_REPLICA_HOSTS', '').split(','))):
+
+    alias = f'replica_{index}'
+
+    DATABASES[alias] = {
+        **DATABASES['default'],
+        'HOST': replica_host.strip(),
+        'TEST': {'MIRROR': 'default'},
+    }
+
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ['auths.routers.PrimaryReplicaRouter']
+
+REPLICA_ROUTED_APPS = ['auths']
+
+# Reads of a client stay on the primary this long after it wrote
+REPLICA_PIN_SECONDS = 5
+REPLICA_PIN_COOKIE = 'dbPin'
+
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 AUTH_USER_MODEL = 'auths.ProjectUser'
 
@@ -171,6 +381,42 @@ CHANNEL_LAYERS = {
 
 ASGI_APPLICATION = 'project.asgi.application'
 
+# ADMISSION CONTROL
+# WORKER_LIMIT - concurrent requests per worker process
+# NODE_LIMIT - concurrent requests per host, shared through Redis (None disables it)
+# QUEUE_TIMEOUT - seconds a request may wait for a free worker slot
+# RETRY_AFTER - value of the Retry-After header on 503 responses
+# AUTH_ADMISSION_STATS_INTERVAL - seconds between publications of a worker's admitted/shed counters
+
+AUTH_ADMISSION_CONTROL = {
+    'login': {
+        'WORKER_LIMIT': int(os.getenv('ADMISSION_LOGIN_WORKER_LIMIT', 4)),
+        'NODE_LIMIT': int(os.getenv('ADMISSION_LOGIN_NODE_LIMIT', 0)) or None,
+        'QUEUE_TIMEOUT': 0.05,
+        'RETRY_AFTER': 1,
+    },
+    'register': {
+        'WORKER_LIMIT': int(os.getenv('ADMISSION_REGISTER_WORKER_LIMIT', 2)),
+        'NODE_LIMIT': int(os.getenv('ADMISSION_REGISTER_NODE_LIMIT', 0)) or None,
+        'QUEUE_TIMEOUT': 0.1,
+        'RETRY_AFTER': 2,
+    },
+    'register_confirm': {
+        'WORKER_LIMIT': int(os.getenv('ADMISSION_REGISTER_CONFIRM_WORKER_LIMIT', 2)),
+        'NODE_LIMIT': int(os.getenv('ADMISSION_REGISTER_CONFIRM_NODE_LIMIT', 0)) or None,
+        'QUEUE_TIMEOUT': 0.05,
+        'RETRY_AFTER': 1,
+    },
+    'password_recovery': {
+        'WORKER_LIMIT': int(os.getenv('ADMISSION_PASSWORD_RECOVERY_WORKER_LIMIT', 2)),
+        'NODE_LIMIT': int(os.getenv('ADMISSION_PASSWORD_RECOVERY_NODE_LIMIT', 0)) or None,
+        'QUEUE_TIMEOUT': 0.05,
+        'RETRY_AFTER': 1,
+    },
+}
+
+AUTH_ADMISSION_STATS_INTERVAL = int(os.getenv('AUTH_ADMISSION_STATS_INTERVAL', 60))
+
 SIMPLE_JWT = {
     "ACCESS_TOKEN_LIFETIME": timedelta(seconds=30),
     "REFRESH_TOKEN_LIFETIME": timedelta(seconds=60),
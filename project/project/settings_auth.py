@@ -0,0 +1,41 @@
+"""
+Auth-only deployment profile.
+
+Nodes that only serve the JSON endpoints under /auth/ select it with
+DJANGO_SETTINGS_MODULE=project.settings_auth. It drops the admin, sessions,
+messages, static files, templates, CORS handling and channel layers from
+project.settings, together with the middleware that only they need.
+"""
+
+from project.settings import *  # noqa: F401,F403
+
+
+INSTALLED_APPS = [
+    'rest_framework',
+    'rest_framework_simplejwt',
+
+    'django.contrib.auth',
+    'django.contrib.contenttypes',
+
+    'auths'
+]
+
+MIDDLEWARE = [
+    'auths.middleware.ForwardAuthMiddleware',
+    'auths.middleware.ReplicaPinningMiddleware',
+    'django.middleware.security.SecurityMiddleware',
+    'auths.middleware.ProfilingMiddleware',
+]
+
+TEMPLATES = []
+
+REST_FRAMEWORK = {
+    'DEFAULT_AUTHENTICATION_CLASSES': (
+        'auths.authentication.VersionedJWTAuthentication',
+    ),
+    'DEFAULT_RENDERER_CLASSES': (
+        'rest_framework.renderers.JSONRenderer',
+    ),
+}
+
+del CHANNEL_LAYERS  # noqa: F821
@@ -14,10 +14,16 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
-from django.contrib import admin
+from django.apps import apps
 from django.urls import path, include
 
 urlpatterns = [
-    path('admin/', admin.site.urls),
     path('auth/', include('auths.urls'))
 ]
+
+# The auth-only profile (project.settings_auth) does not install the admin.
+if apps.is_installed('django.contrib.admin'):
+
+    from django.contrib import admin
+
+    urlpatterns.append(path('admin/', admin.site.urls))